@@ -1,8 +1,6 @@
-import os
 from datetime import timedelta, datetime
-from typing import Union, Annotated
+from typing import Annotated, Tuple, Union
 
-from dotenv import load_dotenv
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
@@ -10,16 +8,16 @@ from jose import jwt, JWTError
 from app.bot.bot import bot
 from app.database.database import database
 from app.models.token import TokenData, Token
-from app.models.user import TelegramUser, UserCurrent, User
+from app.models.user import TelegramUser, UserCurrent
+from app.settings import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, AUTH_CACHE_SIZE, JWT_SECRET
+from app.utils.cache import VerifiedCache
+from app.utils.metrics import metrics
 from app.utils.utils import get_telegram_user
 
 router = APIRouter()
 
-load_dotenv()
-
-SECRET_KEY = os.getenv('JWT_SECRET')
-ALGORITHM = os.getenv('ALGORITHM')
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES'))
+access_token_cache = VerifiedCache(maxsize=AUTH_CACHE_SIZE)
+metrics.register_stats("auth_access_token_cache", access_token_cache.stats)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth")
 
@@ -33,22 +31,29 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
         expire = datetime.utcnow() + timedelta(minutes=15)
 
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=ALGORITHM)
 
     return encoded_jwt
 
 
-async def get_user(user_id: int) -> Union[User, None]:
-    return await database.get_user(user_id)
-
+def decode_access_token(token: str) -> Tuple[TokenData, float]:
+    """Checks the access token signature and expiry.
 
-async def get_user_hub(user_id: int, hub_id: Union[int, str, None]) -> Union[int, None]:
-    hub = await database.get_user_hub(user_id, hub_id)
+    Returns:
+        Tuple[TokenData, float]: The claims and the Unix time the token expires at. Tokens without exp are not
+        cached.
+    """
+    payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
 
-    return hub.hub_id if hub else None
+    return TokenData(user_id=int(payload.get("sub")), hub_id=payload.get("hub")), payload.get("exp", 0)
 
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> UserCurrent:
+    return await authenticate(token)
+
+
+async def authenticate(token: str) -> UserCurrent:
+    """Resolves an access token to the current user. Raises 401 when the token or the user is invalid."""
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -56,24 +61,16 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> Use
     )
 
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = int(payload.get("sub"))
-        hub_id = payload.get("hub")
-
-        if user_id is None:
-            raise credentials_exception
-
-        token_data = TokenData(user_id=user_id, hub_id=hub_id)
-    except JWTError:
+        token_data = access_token_cache.verify(token, decode_access_token)
+    except (JWTError, TypeError, ValueError):
         raise credentials_exception
 
-    user = await get_user(token_data.user_id)
-    hub_id = await get_user_hub(token_data.user_id, token_data.hub_id)
+    user = await database.get_current_user(token_data.user_id, token_data.hub_id)
 
     if user is None:
         raise credentials_exception
 
-    return UserCurrent(hub_id=hub_id, **user.model_dump())
+    return user
 
 
 @router.post("", response_model=Token, response_description="Authenticate user")
@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends
 
 from app.api.auth import get_current_user
 from app.database.database import database
-from app.models.like import LikeResponse
+from app.models.like import LikeAction, LikeBatchRequest, LikeBatchResponse, LikeBatchResponseItem, LikeResponse
 from app.models.user import UserCurrent
 
 router = APIRouter()
@@ -15,3 +15,14 @@ async def like(id: int, user: Annotated[UserCurrent, Depends(get_current_user)])
     is_mutual = await database.like(user.user_id, id)
 
     return LikeResponse(mutual=is_mutual)
+
+
+@router.post("/batch", response_model=LikeBatchResponse, response_description="Apply likes and unlikes in order")
+async def like_batch(batch: LikeBatchRequest, user: Annotated[UserCurrent, Depends(get_current_user)]):
+    mutual = await database.like_many(
+        user.user_id, [(operation.id, operation.action == LikeAction.like) for operation in batch.operations])
+
+    return LikeBatchResponse([
+        LikeBatchResponseItem(id=operation.id, mutual=is_mutual)
+        for operation, is_mutual in zip(batch.operations, mutual)
+    ])
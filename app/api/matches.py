@@ -0,0 +1,21 @@
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from app.api.auth import get_current_user
+from app.api.users import MAX_PAGE_SIZE, PAGE_SIZE, to_response_item
+from app.database.database import database
+from app.models.user import UsersPageResponse, UserCurrent
+from app.utils.utils import decode_cursor, encode_cursor
+
+router = APIRouter()
+
+
+@router.get("", response_model=UsersPageResponse, response_description="Get a page of mutual matches")
+async def get_matches(user: Annotated[UserCurrent, Depends(get_current_user)], cursor: Optional[str] = None,
+                      limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = PAGE_SIZE):
+    matches = await database.mutual_matches(user.user_id, after=decode_cursor(cursor), limit=limit)
+
+    next_cursor = encode_cursor(matches[-1].user_id) if len(matches) == limit else None
+
+    return UsersPageResponse(items=[to_response_item(match) for match in matches], next=next_cursor)
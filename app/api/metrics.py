@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from app.database.monitoring import query_report
+from app.utils.metrics import metrics
+
+router = APIRouter()
+
+
+@router.get("", response_class=PlainTextResponse, response_description="Prometheus metrics of this worker")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/queries", response_description="Mongo query shapes by route, with MONGO_QUERY_REPORT enabled")
+async def get_query_report():
+    if query_report is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    return query_report.summary()
@@ -1,16 +1,85 @@
+import mimetypes
 import os
+import re
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from app.bot.photos import IMAGES_DIR
+from app.settings import STATIC_CACHE_BYTES, STATIC_CACHE_ITEM_BYTES
+from app.utils.cache import BytesLRU
+from app.utils.metrics import metrics
+from app.utils.utils import etag_matches
 
 router = APIRouter()
 
+# Names derived from the file contents never change their bytes and can be cached forever.
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{32,64}(_\w+)?\.\w+$')
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MUTABLE_CACHE_CONTROL = "public, max-age=300, must-revalidate"
 
-@router.get("/images/{filename}")
-def serve_static_files(filename: str):
-    path = f"./../f/images/{filename}"
+images = BytesLRU(max_bytes=STATIC_CACHE_BYTES, max_item_bytes=STATIC_CACHE_ITEM_BYTES)
+metrics.register_stats("static_image_cache", images.stats)
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def stat_file(path: str) -> Optional[os.stat_result]:
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
 
-    if not os.path.isfile(path):
+    return stat_result if os.path.isfile(path) else None
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@router.get("/images/{filename}")
+async def serve_static_files(filename: str, request: Request):
+    if filename != os.path.basename(filename) or filename.startswith("."):
         raise HTTPException(status_code=404, detail="Item not found")
 
-    return FileResponse(path)
+    path = os.path.join(IMAGES_DIR, filename)
+    immutable = bool(CONTENT_ADDRESSED.match(filename))
+    cached = images.get(path)
+
+    # Content-addressed files never change, so a cached copy needs no stat at all.
+    if cached is not None and immutable:
+        content, etag = cached
+    else:
+        stat_result = await run_in_threadpool(stat_file, path)
+
+        if stat_result is None:
+            images.delete(path)
+
+            raise HTTPException(status_code=404, detail="Item not found")
+
+        etag = make_etag(stat_result)
+        content = cached[0] if cached is not None and cached[1] == etag else None
+
+        if content is None and stat_result.st_size <= images.max_item_bytes:
+            content = await run_in_threadpool(read_file, path)
+            images.set(path, content, etag)
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else MUTABLE_CACHE_CONTROL,
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if content is None:
+        return FileResponse(path, headers=headers, stat_result=stat_result)
+
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    return Response(content=content, media_type=media_type, headers=headers)
@@ -3,10 +3,10 @@ from typing import Annotated
 from fastapi import APIRouter, Depends
 
 from app.api.auth import get_current_user
-from app.bot.bot import bot
 from app.database.database import database
 from app.models.hubs import HubResponse
 from app.models.user import UserCurrent, UserResponse, UserUpdate
+from app.utils.utils import photo_url
 
 router = APIRouter()
 
@@ -15,8 +15,6 @@ router = APIRouter()
 async def get_user(user: Annotated[UserCurrent, Depends(get_current_user)]):
     hub = await database.get_user_hub(user.user_id, user.hub_id)
 
-    telegram_user_info = await bot.load_user_info(user.user_id)
-
     return UserResponse(
         id=user.user_id,
         about=user.about,
@@ -24,7 +22,7 @@ async def get_user(user: Annotated[UserCurrent, Depends(get_current_user)]):
         firstName=user.first_name,
         lastName=user.last_name,
         workingName=user.working_name,
-        photo=f'api/static/images/{telegram_user_info.photo}.jpg' if telegram_user_info.photo else None,
+        photo=photo_url(user.photos, "big"),
         hub=HubResponse(hubId=hub.hub_id, hubName=hub.hub_nm) if hub else None,
         nickname=user.username
     )
@@ -36,8 +34,6 @@ async def update_user(user: Annotated[UserCurrent, Depends(get_current_user)], v
 
     hub = await database.get_user_hub(_user.user_id, user.hub_id)
 
-    telegram_user_info = await bot.load_user_info(user.user_id)
-
     return UserResponse(
         id=_user.user_id,
         about=_user.about,
@@ -45,7 +41,7 @@ async def update_user(user: Annotated[UserCurrent, Depends(get_current_user)], v
         firstName=_user.first_name,
         lastName=_user.last_name,
         workingName=_user.working_name,
-        photo=f'api/static/images/{telegram_user_info.photo}.jpg' if telegram_user_info.photo else None,
+        photo=photo_url(_user.photos, "big"),
         hub=HubResponse(hubId=hub.hub_id, hubName=hub.hub_nm) if hub else None,
         nickname=_user.username
     )
@@ -1,35 +1,144 @@
-from typing import Annotated
+import datetime
+import hashlib
+from enum import Enum
+from typing import Annotated, AsyncIterator, Optional, Union
 
-from fastapi import APIRouter, Depends
+import orjson
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import Response, StreamingResponse
 
 from app.api.auth import get_current_user
 from app.database.database import database
-from app.models.user import UsersResponse, UsersResponseItem, UserCurrent
+from app.models.user import (UsersDeltaResponse, UsersFeedItem, UsersPageResponse, UsersResponseItem, UserCurrent,
+                             UserWithLikes)
+from app.settings import FEED_CACHE_SIZE, FEED_CACHE_TTL, SYNC_OVERLAP
+from app.utils.cache import TTLCache
+from app.utils.metrics import phase
+from app.utils.utils import (decode_cursor, decode_sync_token, encode_cursor, encode_sync_token, etag_matches,
+                             photo_url)
 
 router = APIRouter()
 
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
-@router.get("", response_model=UsersResponse, response_description="Get all users except the current one")
-async def get_users(_user: Annotated[UserCurrent, Depends(get_current_user)]):
-    _users = await database.all_users(_user.user_id, _user.hub_id)
+# Rendered pages keyed by (hub, viewer, cursor, limit), stored with the feed versions they were rendered at.
+feed_cache = TTLCache(ttl=FEED_CACHE_TTL, maxsize=FEED_CACHE_SIZE)
 
-    users: UsersResponse = []
 
-    for user in _users:
-        if user.user_id == _user.user_id:
-            continue
+class StreamFormat(str, Enum):
+    ndjson = "ndjson"
+    json = "json"
 
-        users.append(UsersResponseItem(
-            id=user.user_id,
-            about=user.about,
-            age=user.age,
-            firstName=user.first_name,
-            lastName=user.last_name,
-            like=user.like,
-            likesYou=user.likesYou,
-            nickname=user.username,
-            photo=f'api/static/images/{user.telegram_photo}.jpg' if user.telegram_photo else None,
-            workingName=user.working_name
-        ))
 
-    return users
+def to_response_item(user: UserWithLikes) -> UsersResponseItem:
+    return UsersResponseItem(
+        id=user.user_id,
+        about=user.about,
+        age=user.age,
+        firstName=user.first_name,
+        lastName=user.last_name,
+        like=user.like,
+        likesYou=user.likesYou,
+        nickname=user.username,
+        photo=photo_url(user.photos, "small"),
+        workingName=user.working_name
+    )
+
+
+async def stream_ndjson(items: AsyncIterator[UsersFeedItem]) -> AsyncIterator[bytes]:
+    async for item in items:
+        yield orjson.dumps(item) + b"\n"
+
+
+async def stream_json_array(items: AsyncIterator[UsersFeedItem]) -> AsyncIterator[bytes]:
+    separator = b"["
+
+    async for item in items:
+        yield separator + orjson.dumps(item)
+        separator = b","
+
+    yield b"[]" if separator == b"[" else b"]"
+
+
+def sync_token(started_at: datetime.datetime) -> str:
+    return encode_sync_token(started_at - datetime.timedelta(seconds=SYNC_OVERLAP))
+
+
+def feed_version(user: UserCurrent) -> str:
+    hub_versions, viewer_versions = database.hub_versions, database.viewer_versions
+
+    return (f'{hub_versions.epoch}.{hub_versions.get(user.hub_id)}'
+            f'-{viewer_versions.epoch}.{viewer_versions.get(user.user_id)}')
+
+
+@router.get("", response_model=Union[UsersPageResponse, UsersDeltaResponse],
+            response_description="Get a page of users except the current one, or the changes since a sync token")
+async def get_users(request: Request, _user: Annotated[UserCurrent, Depends(get_current_user)],
+                    cursor: Optional[str] = None,
+                    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = PAGE_SIZE,
+                    stream: Optional[StreamFormat] = None,
+                    since: Optional[str] = None):
+    if since is not None:
+        return await get_users_delta(_user, decode_sync_token(since))
+
+    if stream is not None:
+        # Streams the whole hub, serializing members as they come off the cursor.
+        members = database.iter_users(_user.user_id, _user.hub_id)
+
+        if stream == StreamFormat.ndjson:
+            return StreamingResponse(stream_ndjson(members), media_type="application/x-ndjson")
+
+        return StreamingResponse(stream_json_array(members), media_type="application/json")
+
+    # The page only changes when the hub or the viewer's like flags do, so unchanged polls skip Mongo entirely.
+    # Versions are per worker; changes made by other workers bump them through the shared event broker, and
+    # FEED_CACHE_TTL bounds staleness should an event be dropped.
+    version = feed_version(_user)
+    key = (_user.hub_id, _user.user_id, cursor, limit)
+    cached = feed_cache.get(key)
+
+    if cached is not None and cached[0] == version:
+        _, etag, body = cached
+    else:
+        started_at = datetime.datetime.now()
+        items = await database.all_users(_user.user_id, _user.hub_id, after=decode_cursor(cursor), limit=limit)
+
+        # The storage returns items already shaped as UsersResponseItem, so they are written out without models.
+        with phase("serialize"):
+            # A full page means there may be more members after the last one.
+            next_cursor = encode_cursor(items[-1]["id"]) if len(items) == limit else None
+
+            page = {"items": items, "next": next_cursor, "sync": None}
+            body = orjson.dumps(page)
+            etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+
+            # The first page hands out the token to sync from once the client has the whole feed. It is left out
+            # of the ETag: a client revalidating an unchanged page keeps its older token, which only syncs a bit more.
+            if cursor is None:
+                page["sync"] = sync_token(started_at)
+                body = orjson.dumps(page)
+        feed_cache.set(key, (version, etag, body))
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def get_users_delta(_user: UserCurrent, since: datetime.datetime) -> Response:
+    """Returns the members who joined or changed their profile and the like edges set or cleared since."""
+
+    started_at = datetime.datetime.now()
+    items, edges = await database.users_since(_user.user_id, _user.hub_id, since)
+
+    with phase("serialize"):
+        body = orjson.dumps({
+            "items": items,
+            "likes": [{"id": edge.user_id, "like": edge.like, "likesYou": edge.likes_you} for edge in edges],
+            "sync": sync_token(started_at)
+        })
+
+    return Response(content=body, media_type="application/json", headers={"Cache-Control": "private, no-cache"})
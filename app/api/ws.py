@@ -0,0 +1,66 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+
+from app.api.auth import authenticate
+from app.database.database import database
+from app.utils.events import Subscription, hub_channel, user_channel
+
+router = APIRouter()
+
+
+def get_token(websocket: WebSocket, token: Optional[str]) -> Optional[str]:
+    """Browsers cannot set headers on a WebSocket, so the token may also come as a query parameter."""
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+
+    return credentials if scheme.lower() == "bearer" and credentials else token
+
+
+async def receive(websocket: WebSocket) -> None:
+    """Reads until the client disconnects. Clients have nothing to say yet."""
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+
+
+async def send(websocket: WebSocket, subscription: Subscription) -> None:
+    while True:
+        message = await subscription.queue.get()
+
+        # Events were dropped; the client has to catch up with GET /users?since= and reconnect.
+        if subscription.overflowed:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+
+            return
+
+        await websocket.send_text(message)
+
+
+@router.websocket("")
+async def events(websocket: WebSocket, token: Optional[str] = None):
+    try:
+        user = await authenticate(get_token(websocket, token) or "")
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+
+        return
+
+    channels = [user_channel(user.user_id)] + ([hub_channel(user.hub_id)] if user.hub_id is not None else [])
+
+    # Subscribed before accepting, so nothing published after the handshake is missed.
+    with database.events.subscribe(*channels) as subscription:
+        await websocket.accept()
+
+        tasks = [asyncio.ensure_future(receive(websocket)), asyncio.ensure_future(send(websocket, subscription))]
+
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            # Sending to a client that just went away fails; that is a normal disconnect.
+            await asyncio.gather(*tasks, return_exceptions=True)
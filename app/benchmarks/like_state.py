@@ -0,0 +1,144 @@
+"""Compares the per-member $lookup like flags with the batched like_state fetch.
+
+Seeds a synthetic hub into a scratch database and times both feed strategies:
+
+    python -m app.benchmarks.like_state --sizes 100 1000 10000
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, IndexModel
+
+from app.database.database import MongoDB
+from app.database.migrations import migrate_matches
+from app.models.user import UserWithLikes
+from app.settings import DATABASE_NAME, MONGODB_URI
+
+HUB_ID = 1
+VIEWER_ID = 1
+
+
+def lookup_pipeline(user_id: int, hub_id: int) -> List[Dict[str, Any]]:
+    """The previous all_users pipeline joining like flags with two $lookups per member.
+
+    It runs against matches_legacy, which holds the same like graph as one row per directed like.
+    """
+
+    return [
+        {"$match": {"hub_id": hub_id, "user_id": {"$ne": user_id}}},
+        {"$sort": {"user_id": 1}},
+        {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "user_id", "as": "user"}},
+        {"$unwind": "$user"},
+        {"$lookup": {"from": "matches_legacy", "localField": "user_id", "foreignField": "second_user_id",
+                     "as": "like",
+                     "pipeline": [{"$match": {"first_user_id": user_id}}]}},
+        {"$lookup": {"from": "matches_legacy", "localField": "user_id", "foreignField": "first_user_id",
+                     "as": "likes_you",
+                     "pipeline": [{"$match": {"second_user_id": user_id}}]}},
+    ]
+
+
+async def seed(database: MongoDB, members: int, likes_per_member: int) -> None:
+    """Creates one hub with the given number of members and a random like graph."""
+
+    now = datetime.datetime.now()
+    rng = random.Random(members)
+
+    for collection in ("users", "hubs", "hub_x_user", "matches", "matches_legacy"):
+        await database.db[collection].delete_many({})
+
+    await database.db.matches_legacy.create_indexes([
+        IndexModel([("first_user_id", ASCENDING), ("second_user_id", ASCENDING)]),
+        IndexModel([("second_user_id", ASCENDING), ("first_user_id", ASCENDING)]),
+    ])
+
+    await database.db.hubs.insert_one({"hub_id": HUB_ID, "hub_nm": "Benchmark"})
+    await database.db.users.insert_many([
+        {"user_id": user_id, "first_name": f"User {user_id}", "last_name": None, "username": f"user{user_id}",
+         "telegram_photo": str(user_id), "about": None, "age": None, "working_name": f"User {user_id}",
+         "created_at": now, "updated_at": now}
+        for user_id in range(1, members + 1)
+    ])
+    await database.db.hub_x_user.insert_many([
+        {"hub_id": HUB_ID, "user_id": user_id, "profile_id": None, "created_at": now}
+        for user_id in range(1, members + 1)
+    ])
+
+    edges = set()
+
+    for _ in range(members * likes_per_member):
+        first, second = rng.randint(1, members), rng.randint(1, members)
+
+        if first != second:
+            edges.add((first, second))
+
+    if edges:
+        rows = [{"first_user_id": first, "second_user_id": second, "created_at": now} for first, second in edges]
+
+        await database.db.matches_legacy.insert_many([dict(row) for row in rows])
+        await database.db.matches.insert_many(rows)
+        await migrate_matches(database.db)
+
+    await database.ensure_indexes()
+
+
+async def timed(coroutine_factory, repeat: int) -> float:
+    """Returns the best wall time of several runs in milliseconds."""
+
+    best = float("inf")
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coroutine_factory()
+        best = min(best, time.perf_counter() - started)
+
+    return best * 1000
+
+
+async def run(sizes: List[int], likes_per_member: int, repeat: int) -> List[Dict[str, Any]]:
+    database = MongoDB(uri=MONGODB_URI, database=f"{DATABASE_NAME}_bench")
+    results = []
+
+    async def lookup():
+        return [
+            UserWithLikes(**result['user'], like=bool(result['like']), likesYou=bool(result['likes_you']))
+            async for result in database.db.hub_x_user.aggregate(lookup_pipeline(VIEWER_ID, HUB_ID))
+        ]
+
+    async def batched():
+        return await database.all_users(VIEWER_ID, HUB_ID)
+
+    try:
+        for members in sizes:
+            await seed(database, members, likes_per_member)
+
+            results.append({
+                "members": members,
+                "lookup_ms": round(await timed(lookup, repeat), 2),
+                "batched_ms": round(await timed(batched, repeat), 2),
+            })
+    finally:
+        await database.cluster.drop_database(database.db.name)
+        await database.close()
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--likes-per-member", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for result in asyncio.run(run(args.sizes, args.likes_per_member, args.repeat)):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
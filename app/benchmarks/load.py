@@ -0,0 +1,287 @@
+"""Load-tests the HTTP API in-process against synthetic hubs.
+
+Builds hubs with the given number of members and like density in the configured storage, stubs the Bot API,
+then drives /auth, /users, /user and /like through app.main:app at each concurrency level:
+
+    STORAGE_BACKEND=memory python -m app.benchmarks.load --members 1000 --concurrency 1 8 32 --output run.json
+    STORAGE_BACKEND=memory python -m app.benchmarks.load --baseline run.json
+
+Seeding overwrites hubs 1..N and adds users and likes, so MongoDB storage, including the memory backend's snapshot,
+is only seeded when DATABASE_NAME names a scratch database ending in _bench.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import platform
+import random
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import quote
+
+import httpx
+
+from app.api.auth import create_access_token
+from app.bot.bot import bot
+from app.database.database import MongoDB, database
+from app.database.memory import InMemoryDatabase
+from app.database.repository import Repository
+from app.main import app
+from app.models.hubs import Hub
+from app.models.user import TelegramUser, TelegramUserInfo
+from app.settings import BOT_TOKEN, STORAGE_BACKEND
+from app.utils.utils import sign_init_data
+
+ENDPOINTS = ("auth", "users", "user", "like")
+SCRATCH_DATABASE_SUFFIX = "_bench"
+# Member ids of hub h are h * HUB_ID_STRIDE + 1 and up.
+HUB_ID_STRIDE = 1_000_000
+
+
+class StubBot:
+    """Answers the Bot API calls the API makes without leaving the process."""
+
+    def __init__(self) -> None:
+        # Stands in for the HTTP session closed at shutdown too.
+        self.session = self
+
+    async def close(self) -> None:
+        pass
+
+    async def get_me(self):
+        return SimpleNamespace(id=0, username="stub_bot")
+
+    async def get_chat(self, user_id: int):
+        return SimpleNamespace(bio=f"About {user_id}", photo=None)
+
+
+def init_data(user_id: int, hub_id: int, bot_token: str = BOT_TOKEN) -> str:
+    """Builds Web App initData for the user, signed as Telegram signs it."""
+
+    user = json.dumps({"id": user_id, "first_name": f"User {user_id}", "last_name": "Bench",
+                       "username": f"user{user_id}", "language_code": "en"}, separators=(",", ":"))
+    fields = {"auth_date": str(int(time.time())), "start_param": str(hub_id), "user": user}
+
+    fields["hash"] = sign_init_data(fields, bot_token)
+
+    return "&".join(f"{key}={quote(value, safe='')}" for key, value in fields.items())
+
+
+def check_scratch(storage: Repository) -> None:
+    """Refuses storage that would seed a MongoDB database other than a scratch one.
+
+    Raises:
+        ValueError: The storage writes to a database whose name does not end in SCRATCH_DATABASE_SUFFIX.
+    """
+
+    target = storage.snapshot if isinstance(storage, InMemoryDatabase) else storage
+
+    if isinstance(target, MongoDB) and not target.database_name.endswith(SCRATCH_DATABASE_SUFFIX):
+        raise ValueError(f"Refusing to seed MongoDB database {target.database_name!r}: set DATABASE_NAME to a "
+                         f"scratch database ending in {SCRATCH_DATABASE_SUFFIX} or use STORAGE_BACKEND=memory")
+
+
+async def generate(storage: Repository, hubs: int, members: int, like_density: float,
+                   seed: int) -> Dict[int, List[int]]:
+    """Creates hubs of members who each like like_density of their hub at random.
+
+    Returns:
+        Dict[int, List[int]]: Hub id mapped to its member ids.
+    """
+
+    rng = random.Random(seed)
+    hub_members: Dict[int, List[int]] = {}
+
+    for hub_id in range(1, hubs + 1):
+        await storage.add_hub(Hub(hub_id=hub_id, hub_nm=f"Hub {hub_id}"))
+
+        member_ids = [hub_id * HUB_ID_STRIDE + index for index in range(1, members + 1)]
+        hub_members[hub_id] = member_ids
+
+        for user_id in member_ids:
+            await storage.update_or_create_user(
+                TelegramUser(id=user_id, first_name=f"User {user_id}", last_name="Bench", username=f"user{user_id}",
+                             language_code="en", start_param=hub_id),
+                TelegramUserInfo(about=f"About {user_id}"))
+
+        likes = round(like_density * (members - 1))
+
+        for user_id in member_ids:
+            others = rng.sample(member_ids, min(likes + 1, members))
+            await storage.like_many(user_id, [(other, True) for other in others if other != user_id][:likes])
+
+    return hub_members
+
+
+def percentile(latencies: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted latencies."""
+
+    if not latencies:
+        return 0.0
+
+    return latencies[max(0, math.ceil(q / 100 * len(latencies)) - 1)]
+
+
+async def measure(request: Callable[[], Awaitable[httpx.Response]], requests: int,
+                  concurrency: int) -> Dict[str, Any]:
+    """Sends requests with concurrency workers and summarizes latency in milliseconds and throughput."""
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker() -> None:
+        nonlocal errors, remaining
+
+        while remaining > 0:
+            remaining -= 1
+            started_at = time.perf_counter()
+            response = await request()
+            latencies.append((time.perf_counter() - started_at) * 1000)
+
+            if response.status_code >= 400:
+                errors += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+    }
+
+
+def request_factories(client: httpx.AsyncClient, hub_members: Dict[int, List[int]],
+                      rng: random.Random) -> Dict[str, Callable[[], Awaitable[httpx.Response]]]:
+    members = [(hub_id, user_id) for hub_id, member_ids in hub_members.items() for user_id in member_ids]
+    tokens = {user_id: create_access_token({"sub": str(user_id), "hub": hub_id}) for hub_id, user_id in members}
+
+    def viewer():
+        hub_id, user_id = rng.choice(members)
+
+        return hub_id, user_id, {"Authorization": f"Bearer {tokens[user_id]}"}
+
+    def auth():
+        hub_id, user_id = rng.choice(members)
+
+        return client.post("/auth", headers={"Authorization": f"Bearer {init_data(user_id, hub_id)}"})
+
+    def users():
+        return client.get("/users", headers=viewer()[2])
+
+    def user():
+        return client.get("/user", headers=viewer()[2])
+
+    def like():
+        hub_id, user_id, headers = viewer()
+
+        return client.post("/like", params={"id": rng.choice(hub_members[hub_id])}, headers=headers)
+
+    return {"auth": auth, "users": users, "user": user, "like": like}
+
+
+async def run(hubs: int, members: int, like_density: float, concurrency: List[int], requests: int,
+              endpoints: List[str], seed: int) -> Dict[str, Any]:
+    check_scratch(database)
+
+    bot.bot = StubBot()
+    rng = random.Random(seed)
+    results = []
+
+    async with app.router.lifespan_context(app):
+        hub_members = await generate(database, hubs, members, like_density, seed)
+
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            factories = request_factories(client, hub_members, rng)
+
+            for level in concurrency:
+                for endpoint in endpoints:
+                    results.append({"endpoint": endpoint, "concurrency": level,
+                                    **await measure(factories[endpoint], requests, level)})
+
+    return {
+        "meta": {
+            "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "storage": STORAGE_BACKEND,
+            "hubs": hubs,
+            "members": members,
+            "like_density": like_density,
+            "requests": requests,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Pairs results by endpoint and concurrency and flags p95 latencies more than tolerance slower."""
+
+    previous = {(result["endpoint"], result["concurrency"]): result for result in baseline["results"]}
+    comparison = []
+
+    for result in current["results"]:
+        before: Optional[Dict[str, Any]] = previous.get((result["endpoint"], result["concurrency"]))
+
+        if before is None or not before["p95_ms"]:
+            continue
+
+        ratio = result["p95_ms"] / before["p95_ms"]
+        comparison.append({"endpoint": result["endpoint"], "concurrency": result["concurrency"],
+                           "p95_ratio": round(ratio, 3), "regression": ratio > 1 + tolerance})
+
+    return comparison
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hubs", type=int, default=1)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--like-density", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the results to this JSON file instead of stdout")
+    parser.add_argument("--baseline", help="Compare p95 latencies with a previous results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown against the baseline")
+    args = parser.parse_args()
+
+    try:
+        check_scratch(database)
+    except ValueError as e:
+        parser.error(str(e))
+
+    result = asyncio.run(run(args.hubs, args.members, args.like_density, args.concurrency, args.requests,
+                             args.endpoints, args.seed))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        print(json.dumps(result, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison = compare(json.load(f), result, args.tolerance)
+
+        for row in comparison:
+            print(json.dumps(row), file=sys.stderr)
+
+        if any(row["regression"] for row in comparison):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Compares the per-item cost of the /users page serialization paths.
+
+Runs without MongoDB on synthetic members, timing what the route does with the documents the cursor returns:
+
+    python -m app.benchmarks.serialization --sizes 50 200 1000
+
+By default the projected items come from projected_documents, a Python re-implementation of feed_item_projection,
+so the check that both paths agree says nothing about the real pipeline. With --mongo the members are written to a
+throwaway database on MONGODB_URI and the projected items are what the feed aggregation returns. Each result
+names its source in "projected_by".
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List, Set
+
+import bson
+import orjson
+
+from app.api.users import to_response_item
+from app.database.database import MongoDB
+from app.models.user import UsersPageResponse, UserWithLikes
+from app.settings import DATABASE_NAME, MONGODB_URI
+from app.utils.utils import photo_url
+
+
+def full_documents(members: int, seed: int) -> List[Dict[str, Any]]:
+    """Builds hub_x_user rows joined with their whole users documents, as the unprojected pipeline returned them."""
+
+    now = datetime.datetime.now()
+    rng = random.Random(seed)
+
+    return [
+        {
+            "_id": bson.ObjectId(), "hub_id": 1, "user_id": user_id, "profile_id": None, "created_at": now,
+            "user": {
+                "_id": bson.ObjectId(), "user_id": user_id, "first_name": f"User {user_id}", "last_name": "Bench",
+                "username": f"user{user_id}", "telegram_photo": str(user_id),
+                "photos": {"small": f"{user_id:032x}_small.jpg", "big": f"{user_id:032x}_big.jpg"},
+                "about": "About " * rng.randint(1, 40), "age": rng.choice([None, 20, 30, "25"]),
+                "working_name": f"User {user_id}", "created_at": now, "updated_at": now,
+            },
+        }
+        for user_id in range(2, members + 2)
+    ]
+
+
+def projected_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Re-implements feed_item_projection in Python; only checked against the real pipeline with --mongo."""
+
+    projected = []
+
+    for document in documents:
+        user = document["user"]
+        age = user["age"]
+
+        projected.append({
+            "id": user["user_id"], "about": user.get("about"), "age": int(age) if age is not None else None,
+            "firstName": user["first_name"], "lastName": user.get("last_name"),
+            "photo": photo_url(user.get("photos"), "small"),
+            "nickname": user["username"], "workingName": user["working_name"],
+        })
+
+    return projected
+
+
+async def pipeline_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Runs the hub feed aggregation over the documents on a throwaway database and returns its items."""
+
+    database = MongoDB(uri=MONGODB_URI, database=f"{DATABASE_NAME}_bench")
+
+    try:
+        await database.db.users.insert_many([document["user"] for document in documents])
+        await database.db.hub_x_user.insert_many([{key: value for key, value in document.items() if key != "user"}
+                                                  for document in documents])
+
+        return await database.db.hub_x_user.aggregate(MongoDB._all_users_pipeline(1, 1)).to_list(None)
+    finally:
+        await database.cluster.drop_database(database.db.name)
+        await database.close()
+
+
+def models_page(documents: List[Dict[str, Any]], like: Set[int], likes_you: Set[int]) -> bytes:
+    """The previous path: UserWithLikes from the whole document, then UsersResponseItem, then pydantic JSON."""
+
+    users = []
+
+    for document in documents:
+        _user = document["user"]
+        users.append(to_response_item(UserWithLikes(
+            user_id=_user['user_id'], first_name=_user['first_name'], last_name=_user['last_name'],
+            username=_user['username'], telegram_photo=_user['telegram_photo'], photos=_user.get('photos'),
+            like=_user['user_id'] in like, likesYou=_user['user_id'] in likes_you, about=_user.get('about'),
+            working_name=_user['working_name'], age=_user.get('age'))))
+
+    return UsersPageResponse(items=users, next=None).model_dump_json().encode()
+
+
+def projected_page(documents: List[Dict[str, Any]], like: Set[int], likes_you: Set[int]) -> bytes:
+    """The current path: like flags set on the projected items, then orjson."""
+
+    items = [MongoDB._with_likes(dict(document), like, likes_you) for document in documents]
+
+    return orjson.dumps({"items": items, "next": None, "sync": None})
+
+
+def per_item_us(serialize: Callable[[], bytes], items: int, repeat: int) -> float:
+    """Returns the best time of several runs in microseconds per item."""
+
+    best = float("inf")
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        serialize()
+        best = min(best, time.perf_counter() - started)
+
+    return best / items * 1e6
+
+
+def run(sizes: List[int], repeat: int, seed: int, mongo: bool = False) -> List[Dict[str, Any]]:
+    results = []
+
+    for members in sizes:
+        documents = full_documents(members, seed)
+        projected = projected_documents(documents)
+
+        if mongo:
+            # The Python projection is only a stand-in: it has to match what MongoDB returns.
+            pipeline = asyncio.run(pipeline_documents(documents))
+            assert pipeline == projected
+            projected = pipeline
+
+        rng = random.Random(seed)
+        like = {document["user_id"] for document in documents if rng.random() < 0.3}
+        likes_you = {document["user_id"] for document in documents if rng.random() < 0.3}
+
+        # Both paths must write the same items.
+        assert json.loads(models_page(documents, like, likes_you))["items"] == \
+            json.loads(projected_page(projected, like, likes_you))["items"]
+
+        results.append({
+            "members": members,
+            "projected_by": "mongo" if mongo else "python",
+            "models_us_per_item": round(per_item_us(lambda: models_page(documents, like, likes_you), members,
+                                                    repeat), 2),
+            "projected_us_per_item": round(per_item_us(lambda: projected_page(projected, like, likes_you), members,
+                                                       repeat), 2),
+            "full_bson_bytes_per_item": len(b"".join(bson.encode(document) for document in documents)) // members,
+            "projected_bson_bytes_per_item": len(b"".join(bson.encode(item) for item in projected)) // members,
+        })
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo", action="store_true", help="project the members with the real pipeline")
+    args = parser.parse_args()
+
+    for result in run(args.sizes, args.repeat, args.seed, args.mongo):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
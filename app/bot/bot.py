@@ -1,26 +1,67 @@
-import os
-import urllib.request
+import logging
+import time
+
+from typing import Optional
 
 from aiogram import Bot
-from dotenv import load_dotenv
+from aiogram.client.session.aiohttp import AiohttpSession
 
+from app.bot.photos import PhotoDownloader
+from app.bot.scheduler import BotScheduler, Priority
 from app.models.user import TelegramUserInfo
+from app.settings import BOT_TOKEN, TELEGRAM_TIMEOUT, USER_INFO_CACHE_SIZE, USER_INFO_FRESH_TTL, USER_INFO_STALE_TTL
+from app.utils.cache import SingleFlight, TTLCache
+from app.utils.metrics import metrics, untimed
 
-load_dotenv()
-
-BOT_TOKEN = os.getenv('BOT_TOKEN')
+logger = logging.getLogger(__name__)
 
 
 class TelegramBot:
     """A Telegram bot class."""
 
-    def __init__(self, token: str, parse_mode: str = "html") -> None:
-        """Initializes a MongoDB connection using AsyncIOMotorClient."""
+    def __init__(self, token: str, parse_mode: str = "html", timeout: float = TELEGRAM_TIMEOUT) -> None:
+        """Configures the bot. The aiogram Bot and its HTTP session are created by start() or on first use."""
         self.token = token
-        self.bot = Bot(token=self.token, parse_mode=parse_mode)
+        self.parse_mode = parse_mode
+        self.timeout = timeout
+        self.scheduler = BotScheduler()
+        self.photos = PhotoDownloader(None, self.scheduler)
+        self._bot: Optional[Bot] = None
+        self.user_info = TTLCache(ttl=USER_INFO_STALE_TTL, maxsize=USER_INFO_CACHE_SIZE)
+        self._user_info_requests = SingleFlight()
+
+    @property
+    def bot(self) -> Bot:
+        if self._bot is None:
+            self.bot = Bot(token=self.token, parse_mode=self.parse_mode, session=AiohttpSession(timeout=self.timeout))
+
+        return self._bot
+
+    @bot.setter
+    def bot(self, bot: Bot) -> None:
+        self._bot = bot
+        self.photos.bot = bot
+
+    async def start(self) -> None:
+        """Opens the connection to the Bot API before the worker accepts requests. Failures are only logged."""
+        try:
+            await self.scheduler.call(lambda: self.bot.get_me())
+        except Exception as e:
+            logger.warning("Could not reach the Bot API: %s", e)
+
+    async def close(self) -> None:
+        await self.photos.close()
+        await self.scheduler.close()
+
+        if self._bot is not None:
+            await self._bot.session.close()
+            self._bot = None
 
     async def load_user_info(self, user_id: str) -> TelegramUserInfo:
-        """Loads telegram user's bio and photo. Downloads image.
+        """Returns telegram user's bio and photo.
+
+        Results are cached. Entries older than USER_INFO_FRESH_TTL are still served while a background
+        refresh runs, and concurrent callers for the same user share one getChat call.
 
         Args:
             user_id: Telegram user id.
@@ -29,23 +70,45 @@ class TelegramBot:
             TelegramUserInfo: Telegram user info object.
         """
 
-        user = await self.bot.get_chat(user_id)
-        file_name = f'{user_id}.jpg'
+        key = int(user_id)
+        cached = self.user_info.get(key)
 
-        if user.photo:
-            file_id = user.photo.big_file_id
+        if cached is None:
+            telegram_user_info = await self._user_info_requests.run(
+                key, lambda: self._fetch_user_info(key, Priority.INTERACTIVE))
+        else:
+            loaded_at, telegram_user_info = cached
+
+            if time.monotonic() - loaded_at > USER_INFO_FRESH_TTL and key not in self._user_info_requests:
+                self._user_info_requests.start(key, lambda: untimed(self._refresh_user_info(key)))
 
-            try:
-                file = await self.bot.get_file(file_id)
+        if telegram_user_info.photo:
+            # Variants are stored in the background, so they are looked up at read time.
+            return telegram_user_info.model_copy(update={"photos": self.photos.variants(key)})
+
+        return telegram_user_info
+
+    async def _fetch_user_info(self, user_id: int, priority: Priority) -> TelegramUserInfo:
+        """Loads telegram user's bio and photo from getChat. Schedules the image download in the background."""
+
+        user = await self.scheduler.call(lambda: self.bot.get_chat(user_id), priority)
+
+        if user.photo:
+            self.photos.schedule(user_id, user.photo)
 
-                file_path = f'https://api.telegram.org/file/bot{self.token}/{file.file_path}'
+        telegram_user_info = TelegramUserInfo(about=user.bio, photo=str(user_id) if user.photo else None)
+        self.user_info.set(user_id, (time.monotonic(), telegram_user_info))
 
-                urllib.request.urlretrieve(file_path, f"./../f/images/{file_name}")
-                os.chmod(file_path, 0o777)
-            except:
-                pass
+        return telegram_user_info
 
-        return TelegramUserInfo(about=user.bio, photo=str(user_id) if file_name else None)
+    async def _refresh_user_info(self, user_id: int) -> None:
+        try:
+            await self._fetch_user_info(user_id, Priority.BACKGROUND)
+        except Exception as e:
+            # The stale entry keeps being served until the next attempt.
+            logger.warning("Could not refresh info of user %s: %s", user_id, e)
 
 
 bot = TelegramBot(token=BOT_TOKEN, parse_mode='html')
+metrics.register_stats("telegram_scheduler", bot.scheduler.stats)
+metrics.register_stats("telegram_user_info_cache", bot.user_info.stats)
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.types import ChatPhoto
+from starlette.concurrency import run_in_threadpool
+
+from app.bot.scheduler import BotScheduler, Priority
+from app.settings import PHOTO_DOWNLOAD_CONCURRENCY, PHOTO_SHUTDOWN_TIMEOUT
+from app.utils.cache import SingleFlight
+from app.utils.metrics import untimed
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = './../f/images'
+
+# Telegram already renders every profile photo in two sizes; variant name -> ChatPhoto file id field.
+PHOTO_VARIANTS = {
+    "small": "small_file_id",  # 160x160, used by the /users feed.
+    "big": "big_file_id",  # 640x640, used by the profile.
+}
+# Saved with the variants, so a photo already stored by an earlier run or another worker is not downloaded again.
+FILE_UNIQUE_ID = "file_unique_id"
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()[:32]
+
+
+class PhotoDownloader:
+    """Downloads Telegram profile photo variants in the background and stores them under content hashes.
+
+    The variants are passed to on_stored with the photo's file_unique_id. Before downloading, the photos saved for
+    the user are read back with load_stored and the download is skipped when they are of the same photo.
+    """
+
+    def __init__(self, bot: Optional[Bot], scheduler: BotScheduler, directory: str = IMAGES_DIR,
+                 concurrency: int = PHOTO_DOWNLOAD_CONCURRENCY) -> None:
+        self.bot = bot
+        self.scheduler = scheduler
+        self.directory = directory
+        self.concurrency = concurrency
+        self.on_stored: Optional[Callable[[int, Dict[str, str]], Awaitable[None]]] = None
+        self.load_stored: Optional[Callable[[int], Awaitable[Optional[Dict[str, str]]]]] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight = SingleFlight()
+        self._variants: Dict[int, Dict[str, str]] = {}
+
+    def variants(self, user_id: int) -> Optional[Dict[str, str]]:
+        """Returns the stored file name of every variant of the user's last stored photo and its file_unique_id."""
+        return self._variants.get(user_id)
+
+    def schedule(self, user_id: int, photo: ChatPhoto) -> Optional[asyncio.Task]:
+        """Starts downloading the user's photo unless it is already stored or being downloaded.
+
+        Args:
+            user_id: Telegram user id.
+            photo: Chat photo returned by getChat.
+
+        Returns:
+            asyncio.Task: The download task, or None if the stored photo is up to date.
+        """
+
+        if self._variants.get(user_id, {}).get(FILE_UNIQUE_ID) == photo.big_file_unique_id:
+            return None
+
+        return self._in_flight.start(user_id, lambda: untimed(self._download(user_id, photo)))
+
+    async def close(self, timeout: float = PHOTO_SHUTDOWN_TIMEOUT) -> None:
+        """Waits for the downloads in flight, cancelling those not done within timeout seconds.
+
+        Run before the bot session and the scheduler are closed, which the downloads still use.
+        """
+        await self._in_flight.wait(timeout)
+
+    async def _download(self, user_id: int, photo: ChatPhoto) -> None:
+        # Created lazily so the semaphore binds to the running server loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        if self.load_stored is not None:
+            try:
+                stored = await self.load_stored(user_id)
+            except Exception as e:
+                logger.warning("Could not read stored photos of user %s: %s", user_id, e)
+                stored = None
+
+            if stored and stored.get(FILE_UNIQUE_ID) == photo.big_file_unique_id:
+                self._variants[user_id] = stored
+
+                return
+
+        variants: Dict[str, str] = {FILE_UNIQUE_ID: photo.big_file_unique_id}
+
+        async with self._semaphore:
+            try:
+                for variant, file_id_field in PHOTO_VARIANTS.items():
+                    variants[variant] = await self._store(user_id, variant, getattr(photo, file_id_field))
+            except Exception as e:
+                logger.warning("Could not download photo of user %s: %s", user_id, e)
+
+                return
+
+        self._variants[user_id] = variants
+
+        if self.on_stored is not None:
+            try:
+                await self.on_stored(user_id, variants)
+            except Exception as e:
+                logger.warning("Could not save photo variants of user %s: %s", user_id, e)
+
+    async def _store(self, user_id: int, variant: str, file_id: str) -> str:
+        """Downloads one variant and renames it to its content hash. Returns the stored file name."""
+
+        partial_path = os.path.join(self.directory, f'.{user_id}_{variant}.part')
+
+        try:
+            file = await self.scheduler.call(lambda: self.bot.get_file(file_id), Priority.BACKGROUND)
+
+            # Streams the file to disk in chunks; the rename keeps readers from seeing partial images.
+            await self.bot.download_file(file.file_path, destination=partial_path)
+
+            file_name = f'{await run_in_threadpool(hash_file, partial_path)}.jpg'
+            path = os.path.join(self.directory, file_name)
+
+            os.replace(partial_path, path)
+            os.chmod(path, 0o644)
+
+            return file_name
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.settings import TELEGRAM_BURST, TELEGRAM_MAX_QUEUE, TELEGRAM_MAX_RETRIES, TELEGRAM_RATE_LIMIT
+from app.utils.metrics import phase
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when the Bot API queue is full and the call is rejected."""
+
+
+class SchedulerClosed(Exception):
+    """Raised to calls still queued when the scheduler is closed."""
+
+
+class BotScheduler:
+    """Dispatches Bot API calls through a global token bucket and a priority queue.
+
+    Interactive calls are always dispatched before queued background ones. A flood-wait answer pauses
+    the whole bucket for retry_after seconds and the call is queued again.
+    """
+
+    def __init__(self, rate: float = TELEGRAM_RATE_LIMIT, burst: int = TELEGRAM_BURST,
+                 max_queue: int = TELEGRAM_MAX_QUEUE, max_retries: int = TELEGRAM_MAX_RETRIES) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+
+        self.dispatched = 0
+        self.retried = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "dispatched": self.dispatched,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+    async def call(self, factory: Callable[[], Awaitable[T]], priority: Priority = Priority.INTERACTIVE) -> T:
+        """Runs factory() once a token is available, retrying flood-wait errors.
+
+        Args:
+            factory: Creates the Bot API call, e.g. ``lambda: bot.get_chat(user_id)``.
+            priority: Queue priority of the call.
+
+        Raises:
+            SchedulerOverloaded: The queue is full.
+            SchedulerClosed: The scheduler was closed while the call was queued.
+            TelegramRetryAfter: Flood control persisted after max_retries attempts.
+        """
+
+        # Queueing for a token counts as time spent on Telegram too.
+        with phase("telegram"):
+            for attempt in range(self.max_retries + 1):
+                await self._acquire(priority)
+
+                try:
+                    return await factory()
+                except TelegramRetryAfter as e:
+                    if attempt == self.max_retries:
+                        raise
+
+                    self.retried += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+
+    async def close(self) -> None:
+        """Stops the worker and fails the calls still queued, so none of their callers waits forever."""
+
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+
+            if not future.done():
+                future.set_exception(SchedulerClosed("Telegram Bot API scheduler is closed"))
+
+    async def _acquire(self, priority: Priority) -> None:
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+
+            raise SchedulerOverloaded("Telegram Bot API queue is full")
+
+        self._ensure_worker()
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._counter), future))
+        self._wakeup.set()
+
+        enqueued_at = time.monotonic()
+
+        await future
+
+        wait = time.monotonic() - enqueued_at
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+
+    def _ensure_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    def _delay(self) -> float:
+        """Returns how long to wait for the next token, refilling the bucket."""
+        now = time.monotonic()
+
+        if now < self._paused_until:
+            # Nothing refills during a flood wait, so no burst goes out the moment it ends.
+            self._tokens = 0.0
+            self._updated_at = self._paused_until
+
+            return self._paused_until - now
+
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+        return 0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    async def _run(self) -> None:
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._delay()
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, future = heapq.heappop(self._queue)
+
+            # Callers cancelled while queued do not consume a token.
+            if future.done():
+                continue
+
+            self._tokens -= 1
+            self.dispatched += 1
+            future.set_result(None)
@@ -1,43 +1,216 @@
+import asyncio
 import datetime
-import os
-from typing import List, Union, Optional
-
-from dotenv import load_dotenv
-from motor.motor_asyncio import AsyncIOMotorClient
-
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.database.hub_registry import HubRegistry
+from app.database.indexes import IndexManager
+from app.database.memory import InMemoryDatabase
+from app.database.monitoring import CommandMonitor, query_report
+from app.database.repository import (Repository, follow_feed_changes, publish_like, publish_member_joined,
+                                     publish_profile_updated)
 from app.models.hub_x_user import HubXUser
 from app.models.hubs import Hub
-from app.models.matches import Matches
-from app.models.user import User, TelegramUser, UserWithLikes, TelegramUserInfo, UserUpdate
-from app.utils.utils import sanitize_input
-
-load_dotenv()
+from app.models.matches import LikeEdge, match_key
+from app.models.user import (User, TelegramUser, UserWithLikes, TelegramUserInfo, UserUpdate, UserCurrent,
+                             UsersFeedItem)
+from app.settings import (CURRENT_USER_CACHE_SIZE, CURRENT_USER_CACHE_TTL, DATABASE_NAME, HUB_CACHE_TTL,
+                          MEMORY_SNAPSHOT_FROM_MONGO, MONGODB_CLIENT_OPTIONS, MONGODB_MIN_POOL_SIZE, MONGODB_URI,
+                          STORAGE_BACKEND)
+from app.utils.cache import TTLCache, VersionCounter
+from app.utils.events import EventHub, create_broker
+from app.utils.metrics import metrics
+from app.utils.utils import IMAGES_URL, sanitize_input
+
+
+def feed_item_projection(user: str) -> Dict[str, Any]:
+    """Builds a $project stage shaping the users document at the given path into a UsersFeedItem.
+
+    Only the response fields leave the server. The like flags are added in Python, and the photo follows
+    photo_url with the small variant.
+
+    Args:
+        user: Path prefix of the users document, "$" or e.g. "$user.".
+    """
+
+    return {
+        "$project": {
+            "_id": 0,
+            "id": f"{user}user_id",
+            "about": {"$ifNull": [f"{user}about", None]},
+            # Ages saved from the profile form may be numeric strings.
+            "age": {"$convert": {"input": f"{user}age", "to": "int", "onError": None, "onNull": None}},
+            "firstName": f"{user}first_name",
+            "lastName": {"$ifNull": [f"{user}last_name", None]},
+            # Missing and null sort before every string, so this is photo_url's check for a stored variant.
+            "photo": {
+                "$cond": [
+                    {"$gt": [f"{user}photos.small", ""]},
+                    {"$concat": [IMAGES_URL, f"{user}photos.small"]},
+                    None
+                ]
+            },
+            "nickname": f"{user}username",
+            "workingName": f"{user}working_name",
+        }
+    }
 
 
 class MongoDB:
     """A MongoDB database management class."""
 
-    def __init__(self, uri: str, database: str) -> None:
-        """Initializes a MongoDB connection using AsyncIOMotorClient."""
-        self.cluster: AsyncIOMotorClient = AsyncIOMotorClient(uri)
-        self.db = self.cluster[database]
+    def __init__(self, uri: str, database: str, events: Optional[EventHub] = None, **client_options: Any) -> None:
+        """Configures a MongoDB connection. The AsyncIOMotorClient is created by connect() or on first use."""
+        self.uri = uri
+        self.database_name = database
+        # Every command is attributed to the request that issued it, see CommandMonitor.
+        self.monitor = CommandMonitor(report=query_report)
+        self.client_options = {**client_options,
+                               "event_listeners": [*client_options.get("event_listeners", ()), self.monitor]}
+        self._cluster: Optional[AsyncIOMotorClient] = None
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._indexes: Optional[IndexManager] = None
+        self.current_users = TTLCache(ttl=CURRENT_USER_CACHE_TTL, maxsize=CURRENT_USER_CACHE_SIZE)
+        # Hubs and memberships are read from memory, see HubRegistry. Unknown hub ids are remembered here for a
+        # while so bad start parameters don't hit the database either.
+        self.registry = HubRegistry()
+        self.missing_hubs = TTLCache(ttl=HUB_CACHE_TTL)
+        self._registry_refresher: Optional[asyncio.Task] = None
+        # Bumped whenever a hub feed or a viewer's like flags change; GET /users builds its ETag from them.
+        self.hub_versions = VersionCounter()
+        self.viewer_versions = VersionCounter()
+        # Like and profile changes are pushed to connected clients, see app/api/ws.py.
+        self.events = events if events is not None else EventHub()
+        follow_feed_changes(self.events, self.hub_versions, self.viewer_versions)
+
+    @property
+    def cluster(self) -> AsyncIOMotorClient:
+        self.connect()
+
+        return self._cluster
+
+    @property
+    def db(self) -> AsyncIOMotorDatabase:
+        self.connect()
+
+        return self._db
+
+    @property
+    def indexes(self) -> IndexManager:
+        self.connect()
+
+        return self._indexes
+
+    def connect(self) -> None:
+        """Creates the client. Connections are opened lazily by the driver, see start()."""
+        if self._cluster is None:
+            self._cluster = AsyncIOMotorClient(self.uri, **self.client_options)
+            self._db = self._cluster[self.database_name]
+            self._indexes = IndexManager(self._db)
+
+    async def start(self, warm_connections: int = MONGODB_MIN_POOL_SIZE) -> None:
+        """Connects, creates the indexes, loads the hub registry and opens warm_connections pooled connections.
+
+        Run before the worker accepts requests, so the first burst of traffic does not wait for handshakes.
+        """
+        self.connect()
+
+        # Concurrent pings each check out their own connection, which then stays in the pool.
+        await asyncio.gather(self.ensure_indexes(), self.registry.refresh(self.db),
+                             *[self.db.command("ping") for _ in range(warm_connections)])
+
+        self._registry_refresher = asyncio.ensure_future(self.registry.run(self.db))
 
     async def close(self) -> None:
         """Closes the database connection."""
-        self.cluster.close()
+        if self._registry_refresher is not None:
+            self._registry_refresher.cancel()
+            self._registry_refresher = None
+
+        if self._cluster is not None:
+            self._cluster.close()
+            self._cluster = self._db = self._indexes = None
 
-    async def all_users(self, user_id: int, hub_id: int) -> List[UserWithLikes]:
-        """Returns all users list.
+    async def ensure_indexes(self) -> None:
+        """Creates the indexes every query below relies on."""
+        await self.indexes.ensure()
+
+    async def verify_indexes(self, user_id: int = 0, hub_id: int = 0) -> Dict[str, List[str]]:
+        """Explains every query shape issued by this class.
 
         Returns:
-            List[User]: Collection of User objects.
+            Dict[str, List[str]]: Query shapes planning a collection scan.
+        """
+        return await self.indexes.verify(self.query_shapes(user_id, hub_id))
+
+    def query_shapes(self, user_id: int, hub_id: int) -> Dict[str, Dict[str, Any]]:
+        """Returns explainable commands for every query shape issued by this class.
+
+        Keep in sync with the methods below whenever a filter or pipeline changes.
         """
 
-        users: list[UserWithLikes] = []
+        return {
+            "all_users": {"aggregate": "hub_x_user", "pipeline": self._all_users_pipeline(user_id, hub_id),
+                          "cursor": {}},
+            "all_users_page": {"aggregate": "hub_x_user",
+                               "pipeline": self._all_users_pipeline(user_id, hub_id, after=user_id, limit=50),
+                               "cursor": {}},
+            "users_joined_since": {"aggregate": "hub_x_user",
+                                   "pipeline": self._joined_users_pipeline(user_id, hub_id, datetime.datetime.min),
+                                   "cursor": {}},
+            "users_changed_since": {"aggregate": "users",
+                                    "pipeline": self._changed_users_pipeline(user_id, hub_id, datetime.datetime.min),
+                                    "cursor": {}},
+            "matches_by_user_id": {"find": "matches", "filter": {
+                "$or": [{"first_user_id": user_id}, {"second_user_id": user_id}]
+            }},
+            "users_by_user_id": {"find": "users", "filter": {"user_id": user_id}, "limit": 1},
+            "hubs_by_hub_id": {"find": "hubs", "filter": {"hub_id": hub_id}, "limit": 1},
+            "hubs_upsert": {"update": "hubs", "updates": [
+                {"q": {"hub_id": hub_id}, "u": {"$set": {"hub_nm": ""}}, "upsert": True}
+            ]},
+            "hub_x_user_hub_ids": {"distinct": "hub_x_user", "key": "hub_id", "query": {"user_id": user_id}},
+            # The registry reads all hubs at every refresh and all memberships once, so only this one is checked.
+            "hub_x_user_created_since": {"find": "hub_x_user", "filter": {"created_at": {"$gt": datetime.datetime.min}},
+                                         "projection": {"_id": 0, "hub_id": 1, "user_id": 1}},
+            "matches_toggle": {"findAndModify": "matches",
+                               "query": {"first_user_id": user_id, "second_user_id": user_id},
+                               "update": self._like_update("first_likes_second", "second_likes_first"),
+                               "upsert": True, "new": True},
+            "mutual_matches_page": {"aggregate": "mutual_matches",
+                                    "pipeline": self._mutual_matches_pipeline(user_id, after=0, limit=50),
+                                    "cursor": {}},
+            "mutual_matches_sync": {"update": "mutual_matches", "updates": [
+                {"q": {"user_id": user_id, "match_user_id": user_id}, "u": self._mutual_update(False, 1),
+                 "upsert": True}
+            ]},
+            "matches_by_pairs": {"find": "matches", "filter": {"$or": [
+                {"first_user_id": user_id, "second_user_id": user_id}, {"first_user_id": 0, "second_user_id": user_id}
+            ]}},
+        }
+
+    @staticmethod
+    def _all_users_pipeline(user_id: int, hub_id: int, after: Optional[int] = None,
+                            limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Builds the hub members aggregation. Like flags are joined in Python, see like_state.
+
+        Members are ordered by user_id, which is unique within a hub and therefore a stable keyset for paging.
+        """
+
+        member_filter: Dict[str, Any] = {"$ne": user_id}
+
+        if after is not None:
+            member_filter["$gt"] = after
 
-        pipeline = [
+        pipeline: List[Dict[str, Any]] = [
             {
-                "$match": {"hub_id": hub_id}
+                "$match": {"hub_id": hub_id, "user_id": member_filter}
+            },
+            {
+                "$sort": {"user_id": 1}
             },
             {
                 "$lookup": {
@@ -49,54 +222,169 @@ class MongoDB:
             },
             {
                 "$unwind": "$user"
-            },
+            }
+        ]
+
+        if limit is not None:
+            pipeline.append({"$limit": limit})
+
+        pipeline.append(feed_item_projection("$user."))
+
+        return pipeline
+
+    async def like_edges(self, user_id: int) -> List[LikeEdge]:
+        """Fetches every like edge touching the user in a single query.
+
+        Unlikes clear the flag instead of deleting the pair, so edges with both flags unset are tombstones.
+
+        Args:
+            user_id: The user telegram id.
+
+        Returns:
+            List[LikeEdge]: Like flags towards every user the user has a pair document with.
+        """
+
+        edges: List[LikeEdge] = []
+
+        cursor = self.db.matches.find(
+            {"$or": [{"first_user_id": user_id}, {"second_user_id": user_id}]},
+            {"_id": 0, "first_user_id": 1, "second_user_id": 1, "first_likes_second": 1, "second_likes_first": 1,
+             "updated_at": 1}
+        )
+
+        async for match in cursor:
+            if match['first_user_id'] == user_id:
+                other_user_id, likes, liked = match['second_user_id'], 'first_likes_second', 'second_likes_first'
+            else:
+                other_user_id, likes, liked = match['first_user_id'], 'second_likes_first', 'first_likes_second'
+
+            edges.append(LikeEdge(user_id=other_user_id, like=bool(match.get(likes)),
+                                  likes_you=bool(match.get(liked)), updated_at=match.get('updated_at')))
+
+        return edges
+
+    async def like_state(self, user_id: int) -> Tuple[Set[int], Set[int]]:
+        """Returns the ids the user likes and the ids of users who like the user."""
+
+        edges = await self.like_edges(user_id)
+
+        return {edge.user_id for edge in edges if edge.like}, {edge.user_id for edge in edges if edge.likes_you}
+
+    async def iter_users(self, user_id: int, hub_id: int, after: Optional[int] = None,
+                         limit: Optional[int] = None) -> AsyncIterator[UsersFeedItem]:
+        """Yields hub members except the user as they come off the cursor.
+
+        Args:
+            user_id: The current user telegram id.
+            hub_id: The hub id.
+            after: Return only members with a greater user id.
+            limit: Maximum number of members to return.
+
+        Yields:
+            UsersFeedItem: The hub member with like flags.
+        """
+
+        like, likes_you = await self.like_state(user_id)
+
+        pipeline = self._all_users_pipeline(user_id, hub_id, after, limit)
+
+        async for item in self.db.hub_x_user.aggregate(pipeline):
+            yield self._with_likes(item, like, likes_you)
+
+    @staticmethod
+    def _with_likes(item: Dict[str, Any], like: Set[int], likes_you: Set[int]) -> UsersFeedItem:
+        item['like'] = item['id'] in like
+        item['likesYou'] = item['id'] in likes_you
+
+        return item
+
+    async def all_users(self, user_id: int, hub_id: int, after: Optional[int] = None,
+                        limit: Optional[int] = None) -> List[UsersFeedItem]:
+        """Returns hub members except the user, ordered by user id.
+
+        Args:
+            user_id: The current user telegram id.
+            hub_id: The hub id.
+            after: Return only members with a greater user id.
+            limit: Maximum number of members to return.
+
+        Returns:
+            List[UsersFeedItem]: The members shaped as feed response items.
+        """
+
+        return [user async for user in self.iter_users(user_id, hub_id, after, limit)]
+
+    async def users_since(self, user_id: int, hub_id: int,
+                          since: datetime.datetime) -> Tuple[List[UsersFeedItem], List[LikeEdge]]:
+        """Returns what changed in the user's feed after since.
+
+        Args:
+            user_id: The current user telegram id.
+            hub_id: The hub id.
+            since: Time of the previous sync.
+
+        Returns:
+            Tuple[List[UsersFeedItem], List[LikeEdge]]: Hub members who joined or changed their profile, ordered
+            by user id, and the like edges set or cleared since then.
+        """
+
+        edges, joined, changed = await asyncio.gather(
+            self.like_edges(user_id),
+            self.db.hub_x_user.aggregate(self._joined_users_pipeline(user_id, hub_id, since)).to_list(None),
+            self.db.users.aggregate(self._changed_users_pipeline(user_id, hub_id, since)).to_list(None)
+        )
+
+        like = {edge.user_id for edge in edges if edge.like}
+        likes_you = {edge.user_id for edge in edges if edge.likes_you}
+
+        members = {item['id']: item for item in joined + changed}
+
+        return (
+            [self._with_likes(members[member_id], like, likes_you) for member_id in sorted(members)],
+            [edge for edge in edges if edge.updated_at is not None and edge.updated_at > since]
+        )
+
+    @staticmethod
+    def _joined_users_pipeline(user_id: int, hub_id: int, since: datetime.datetime) -> List[Dict[str, Any]]:
+        return [
             {
-                "$match": {"user.user_id": {"$ne": user_id}}
+                "$match": {"hub_id": hub_id, "created_at": {"$gt": since}, "user_id": {"$ne": user_id}}
             },
             {
                 "$lookup": {
-                    "from": "matches",
+                    "from": "users",
                     "localField": "user_id",
-                    "foreignField": "second_user_id",
-                    "as": "like",
-                    "pipeline": [
-                        {"$match": {"first_user_id": user_id}}
-                    ]
+                    "foreignField": "user_id",
+                    "as": "user"
                 }
             },
             {
+                "$unwind": "$user"
+            },
+            feed_item_projection("$user.")
+        ]
+
+    @staticmethod
+    def _changed_users_pipeline(user_id: int, hub_id: int, since: datetime.datetime) -> List[Dict[str, Any]]:
+        return [
+            {
+                "$match": {"updated_at": {"$gt": since}, "user_id": {"$ne": user_id}}
+            },
+            {
+                # A user belongs to a handful of hubs, so joining all memberships is cheap.
                 "$lookup": {
-                    "from": "matches",
+                    "from": "hub_x_user",
                     "localField": "user_id",
-                    "foreignField": "first_user_id",
-                    "as": "likes_you",
-                    "pipeline": [
-                        {"$match": {"second_user_id": user_id}}
-                    ]
+                    "foreignField": "user_id",
+                    "as": "memberships"
                 }
-            }
+            },
+            {
+                "$match": {"memberships.hub_id": hub_id}
+            },
+            feed_item_projection("$")
         ]
 
-        async for result in self.db.hub_x_user.aggregate(pipeline):
-            _user = result['user']
-            like = result['like'][0] if result['like'] else None
-            likes_you = result['likes_you'][0] if result['likes_you'] else None
-
-            users.append(UserWithLikes(
-                user_id=_user['user_id'],
-                first_name=_user['first_name'],
-                last_name=_user['last_name'],
-                username=_user['username'],
-                telegram_photo=_user['telegram_photo'],
-                like=bool(like),
-                likesYou=bool(likes_you),
-                about=_user.get('about'),
-                working_name=_user['working_name'],
-                age=_user.get('age')
-            ))
-
-        return users
-
     async def update_or_create_user(self, telegram_user: TelegramUser,
                                     telegram_user_info: TelegramUserInfo = None) -> User:
         """Creates a new user if not exists.
@@ -118,25 +406,27 @@ class MongoDB:
             username=telegram_user.username,
             telegram_photo=telegram_user_info.photo,
             about=telegram_user_info.about
-        ).model_dump()
+        ).model_dump(exclude={"photos"})
 
-        await self.db.users.update_one(
+        # BSON dates keep milliseconds; truncating lets the returned updated_at be compared with now.
+        now = datetime.datetime.now()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        profile = {field: f"${field}" for field in [*_user, "photos"]}
+
+        upsert_user = self.db.users.find_one_and_update(
             {
                 "user_id": telegram_user.id
             },
             [{
+                # Snapshots the stored profile so that updated_at only moves when a login actually changes it.
+                "$set": {"_profile": profile}
+            }, {
                 "$set": {
                     **_user,
                     "age": "$age",
-                    "updated_at": datetime.datetime.now(),
-                    "created_at":
-                        {
-                            "$cond": [
-                                {"$eq": ["$created_at", None]},
-                                "$created_at",
-                                datetime.datetime.now(),
-                            ]
-                        },
+                    # Variants are saved by update_user_photos once downloaded; keep them until the photo is removed.
+                    "photos": (telegram_user_info.photos or "$photos") if telegram_user_info.photo else None,
+                    "created_at": {"$ifNull": ["$created_at", now]},
                     "about": {
                         "$cond": [
                             {"$not": "$about"},
@@ -152,28 +442,117 @@ class MongoDB:
                         ]
                     }
                 }
-            }], upsert=True)
+            }, {
+                "$set": {
+                    "updated_at": {
+                        "$cond": [
+                            {"$eq": ["$_profile", profile]},
+                            {"$ifNull": ["$updated_at", now]},
+                            now,
+                        ]
+                    }
+                }
+            }, {
+                "$unset": "_profile"
+            }], upsert=True, return_document=ReturnDocument.AFTER)
 
-        # Check if hub exists
-        hub = await self.db.hubs.find_one(
-            {"hub_id": int(telegram_user.start_param)}) if telegram_user.start_param else None
+        # The user upsert, the hub membership and the hub ids lookup are independent, so they run concurrently.
+        # The last two are usually answered by the hub registry without a query.
+        result, joined_hub_id, hub_ids = await asyncio.gather(
+            upsert_user, self._join_hub(telegram_user), self._user_hub_ids(telegram_user.id))
 
-        if hub:
-            hub_x_user = await self.db.hub_x_user.find_one(
-                {"hub_id": int(telegram_user.start_param), "user_id": telegram_user.id})
+        self._user_changed(telegram_user.id, hub_ids + [joined_hub_id] if joined_hub_id else hub_ids,
+                           publish=result.get('updated_at') == now)
 
-            # If hub_x_user document doesn't exist create the one.
-            if not hub_x_user:
-                await self.db.hub_x_user.insert_one(
-                    HubXUser(
-                        hub_id=int(telegram_user.start_param),
-                        user_id=telegram_user.id,
-                        created_at=datetime.datetime.now()
-                    ).model_dump())
+        return User(**result)
 
-        result = await self.db.users.find_one({"user_id": telegram_user.id})
+    async def _user_hub_ids(self, user_id: int, hub_id: Optional[int] = None) -> List[int]:
+        """Returns the user's hub ids from the registry.
 
-        return User(**result)
+        Mongo is asked only when the registry knows no hub of the user, or not the wanted hub_id: another worker may
+        have added the membership since the last refresh.
+        """
+
+        hub_ids = self.registry.user_hub_ids(user_id)
+
+        if not hub_ids or (hub_id is not None and hub_id not in hub_ids):
+            hub_ids = sorted(await self.db.hub_x_user.distinct("hub_id", {"user_id": user_id}))
+
+            for member_hub_id in hub_ids:
+                self.registry.join(member_hub_id, user_id)
+
+        return hub_ids
+
+    def _user_changed(self, user_id: int, hub_ids: List[int], publish: bool = True) -> None:
+        """Drops cached data derived from the user's profile and tells the user's hubs about the change."""
+
+        self.current_users.invalidate_tag(user_id)
+        self.hub_versions.bump(*hub_ids)
+
+        if publish:
+            publish_profile_updated(self.events, user_id, hub_ids)
+
+    async def _join_hub(self, telegram_user: TelegramUser) -> Optional[int]:
+        """Adds the user to the hub from the start parameter if the hub exists. Idempotent.
+
+        Returns:
+            int: The hub id, or None if there is no such hub.
+        """
+
+        hub = await self.get_hub(int(telegram_user.start_param)) if telegram_user.start_param else None
+
+        if hub and not self.registry.is_member(hub.hub_id, telegram_user.id):
+            result = await self.db.hub_x_user.update_one(
+                {"hub_id": hub.hub_id, "user_id": telegram_user.id},
+                {"$setOnInsert": HubXUser(
+                    hub_id=hub.hub_id,
+                    user_id=telegram_user.id,
+                    created_at=datetime.datetime.now()
+                ).model_dump()},
+                upsert=True)
+
+            self.registry.join(hub.hub_id, telegram_user.id)
+
+            if result.upserted_id is not None:
+                publish_member_joined(self.events, telegram_user.id, hub.hub_id)
+
+        return hub.hub_id if hub else None
+
+    async def add_hub(self, hub: Hub) -> None:
+        """Creates the hub or renames an existing one."""
+
+        await self.db.hubs.update_one({"hub_id": hub.hub_id}, {"$set": hub.model_dump()}, upsert=True)
+        self.registry.add_hub(hub)
+        self.missing_hubs.delete(hub.hub_id)
+
+    async def get_hub(self, hub_id: int) -> Union[Hub, None]:
+        """Returns hub by id, served from the hub registry.
+
+        Hubs created by another worker since the last refresh are fetched and added to the registry.
+
+        Args:
+            hub_id: The hub id.
+
+        Returns:
+            Hub: The Hub object.
+        """
+
+        hub = self.registry.hub(hub_id)
+
+        if hub is not None or self.missing_hubs.get(hub_id):
+            return hub
+
+        result = await self.db.hubs.find_one({"hub_id": hub_id})
+
+        if result is None:
+            self.missing_hubs.set(hub_id, True)
+
+            return None
+
+        hub = Hub(**result)
+        self.registry.add_hub(hub)
+
+        return hub
 
     async def get_user(self, user_id: int) -> Union[User, None]:
         """Returns user by id.
@@ -192,6 +571,35 @@ class MongoDB:
 
         return User(**result)
 
+    async def get_current_user(self, user_id: int, hub_id: Optional[int] = None) -> Union[UserCurrent, None]:
+        """Returns the user with the resolved hub id, served from an in-process TTL cache.
+
+        Cached entries are dropped by update_or_create_user and update_user.
+
+        Args:
+            user_id: The user telegram id.
+            hub_id: The preferred hub id.
+
+        Returns:
+            UserCurrent: The UserCurrent object.
+        """
+
+        key = (user_id, hub_id)
+        current_user = self.current_users.get(key)
+
+        if current_user is not None:
+            return current_user
+
+        user, hub = await asyncio.gather(self.get_user(user_id), self.get_user_hub(user_id, hub_id))
+
+        if user is None:
+            return None
+
+        current_user = UserCurrent(hub_id=hub.hub_id if hub else None, **user.model_dump())
+        self.current_users.set(key, current_user, tag=user_id)
+
+        return current_user
+
     async def like(self, first_user_id: int, second_user_id: int) -> bool:
         """Toggles user`s like.
 
@@ -203,20 +611,196 @@ class MongoDB:
             bool: Like is mutual.
         """
 
-        like = await self.db.matches.find_one({'first_user_id': first_user_id, 'second_user_id': second_user_id})
+        pair_first_user_id, pair_second_user_id, likes, liked = match_key(first_user_id, second_user_id)
+
+        # One atomic findAndModify flips the flag and returns the reverse one. The unique index on the pair
+        # makes concurrent first likes collapse into a single document.
+        try:
+            match = await self._toggle_like(pair_first_user_id, pair_second_user_id, likes, liked)
+        except DuplicateKeyError:
+            match = await self._toggle_like(pair_first_user_id, pair_second_user_id, likes, liked)
+
+        self.viewer_versions.bump(first_user_id, second_user_id)
+
+        # Only a toggle towards a user who likes back starts or ends a mutual match.
+        if match[liked]:
+            await self._sync_mutual_matches({(pair_first_user_id, pair_second_user_id): (match[likes],
+                                                                                         match['version'])})
+
+        publish_like(self.events, first_user_id, second_user_id, match[likes], match[liked])
+
+        return match[likes] and match[liked]
+
+    async def _toggle_like(self, first_user_id: int, second_user_id: int, likes: str, liked: str) -> Dict[str, Any]:
+        return await self.db.matches.find_one_and_update(
+            {"first_user_id": first_user_id, "second_user_id": second_user_id},
+            self._like_update(likes, liked),
+            projection={"_id": 0, likes: 1, liked: 1, "version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def like_many(self, user_id: int, operations: List[Tuple[int, bool]]) -> List[bool]:
+        """Sets or clears several likes of the user in order with one bulk write.
+
+        Args:
+            user_id: The user id.
+            operations: Liked user id and whether the like is set, applied in order.
+
+        Returns:
+            List[bool]: Whether each like is mutual after the whole batch is applied.
+        """
+
+        if not operations:
+            return []
+
+        keys = [match_key(user_id, liked_user_id) for liked_user_id, _ in operations]
+
+        # Unlikes do not upsert, so clearing a like that never existed writes nothing.
+        await self.db.matches.bulk_write([
+            UpdateOne({"first_user_id": first_user_id, "second_user_id": second_user_id},
+                      self._like_update(likes, liked, value), upsert=value)
+            for (first_user_id, second_user_id, likes, liked), (_, value) in zip(keys, operations)
+        ], ordered=True)
+
+        self.viewer_versions.bump(user_id, *[liked_user_id for liked_user_id, _ in operations])
+
+        pairs = {(first_user_id, second_user_id) for first_user_id, second_user_id, _, _ in keys}
+        matches: Dict[Tuple[int, int], Dict[str, Any]] = {}
+
+        cursor = self.db.matches.find(
+            {"$or": [{"first_user_id": first_user_id, "second_user_id": second_user_id}
+                     for first_user_id, second_user_id in pairs]},
+            {"_id": 0, "first_user_id": 1, "second_user_id": 1, "first_likes_second": 1, "second_likes_first": 1,
+             "version": 1}
+        )
+
+        async for match in cursor:
+            matches[(match['first_user_id'], match['second_user_id'])] = match
+
+        await self._sync_mutual_matches({
+            pair: (bool(match.get('first_likes_second') and match.get('second_likes_first')), match.get('version', 0))
+            for pair, match in matches.items() if match.get('first_likes_second') or match.get('second_likes_first')
+        })
+
+        mutual: List[bool] = []
+        final: Dict[int, Tuple[bool, bool]] = {}
+
+        for (first_user_id, second_user_id, likes, liked), (liked_user_id, _) in zip(keys, operations):
+            match = matches.get((first_user_id, second_user_id), {})
+            mutual.append(bool(match.get(likes) and match.get(liked)))
 
-        if like:
-            await self.db.matches.delete_many({'first_user_id': first_user_id, 'second_user_id': second_user_id})
+            if match:
+                final[liked_user_id] = bool(match.get(likes)), bool(match.get(liked))
 
-            return False
-        else:
-            await self.db.matches.insert_one(
-                Matches(first_user_id=first_user_id, second_user_id=second_user_id,
-                        created_at=datetime.datetime.now()).model_dump())
+        # The batch does not read the flags it overwrites, so a repeated like is published again.
+        for liked_user_id, (like, liked_back) in final.items():
+            publish_like(self.events, user_id, liked_user_id, like, liked_back)
 
-        mutual_like = await self.db.matches.find_one({'first_user_id': second_user_id, 'second_user_id': first_user_id})
+        return mutual
 
-        return bool(mutual_like)
+    async def _sync_mutual_matches(self, pairs: Dict[Tuple[int, int], Tuple[bool, int]]) -> None:
+        """Sets whether every pair is mutual on the mutual_matches documents of both users with one bulk write.
+
+        Writes of two fast toggles may reach the server in any order; each one only applies if it carries a newer
+        pair version than the document, so the last toggle always wins.
+
+        Args:
+            pairs: Pair of user ids mapped to whether the like is mutual and the pair version it was read at.
+        """
+
+        if not pairs:
+            return
+
+        await self.db.mutual_matches.bulk_write([
+            UpdateOne({"user_id": user_id, "match_user_id": match_user_id}, self._mutual_update(is_mutual, version),
+                      upsert=True)
+            for (first_user_id, second_user_id), (is_mutual, version) in pairs.items()
+            for user_id, match_user_id in ((first_user_id, second_user_id), (second_user_id, first_user_id))
+        ], ordered=False)
+
+    @staticmethod
+    def _mutual_update(is_mutual: bool, version: int) -> List[Dict[str, Any]]:
+        newer = {"$gt": [version, {"$ifNull": ["$pair_version", -1]}]}
+        # A match starting again counts from now.
+        started = {"$and": [newer, is_mutual, {"$ne": ["$mutual", True]}]}
+
+        return [{
+            "$set": {
+                "mutual": {"$cond": [newer, is_mutual, "$mutual"]},
+                "pair_version": {"$cond": [newer, version, "$pair_version"]},
+                "created_at": {"$cond": [started, datetime.datetime.now(), "$created_at"]},
+            }
+        }]
+
+    async def mutual_matches(self, user_id: int, after: Optional[int] = None,
+                             limit: Optional[int] = None) -> List[UserWithLikes]:
+        """Returns users with a mutual like with the user, ordered by user id.
+
+        Args:
+            user_id: The user telegram id.
+            after: Return only matches with a greater user id.
+            limit: Maximum number of matches to return.
+
+        Returns:
+            List[UserWithLikes]: The matched users, with both like flags set.
+        """
+
+        users: List[UserWithLikes] = []
+
+        async for result in self.db.mutual_matches.aggregate(self._mutual_matches_pipeline(user_id, after, limit)):
+            users.append(UserWithLikes(**result['user'], like=True, likesYou=True))
+
+        return users
+
+    @staticmethod
+    def _mutual_matches_pipeline(user_id: int, after: Optional[int] = None,
+                                 limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        # Documents written before ended matches were kept have no mutual field.
+        match_filter: Dict[str, Any] = {"user_id": user_id, "mutual": {"$ne": False}}
+
+        if after is not None:
+            match_filter["match_user_id"] = {"$gt": after}
+
+        pipeline: List[Dict[str, Any]] = [
+            {"$match": match_filter},
+            {"$sort": {"match_user_id": 1}},
+        ]
+
+        if limit is not None:
+            pipeline.append({"$limit": limit})
+
+        pipeline.extend([
+            {
+                "$lookup": {
+                    "from": "users",
+                    "localField": "match_user_id",
+                    "foreignField": "user_id",
+                    "as": "user"
+                }
+            },
+            {
+                "$unwind": "$user"
+            }
+        ])
+
+        return pipeline
+
+    @staticmethod
+    def _like_update(likes: str, liked: str, value: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """Builds the pair update setting the like flag to value, or flipping it when value is None."""
+
+        now = datetime.datetime.now()
+
+        return [{
+            "$set": {
+                likes: {"$not": [{"$ifNull": [f"${likes}", False]}]} if value is None else {"$literal": value},
+                liked: {"$ifNull": [f"${liked}", False]},
+                "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+                "created_at": {"$ifNull": ["$created_at", now]},
+                "updated_at": now
+            }
+        }]
 
     async def get_user_hub(self, user_id: int, hub_id: Optional[int] = None) -> Union[Hub, None]:
         """Returns hub related to user.
@@ -228,21 +812,30 @@ class MongoDB:
             Hub: The Hub object.
         """
 
-        hub_x_user = await self.db.hub_x_user.find_one({"user_id": user_id, "hub_id": hub_id})
+        hub_ids = await self._user_hub_ids(user_id, hub_id)
 
-        if hub_x_user:
-            _hub = await self.db.hubs.find_one({"hub_id": hub_x_user['hub_id']})
+        if not hub_ids:
+            return None
 
-            return Hub(**_hub)
-        else:
-            hub_x_user = await self.db.hub_x_user.find_one({"user_id": user_id})
+        return await self.get_hub(hub_id if hub_id in hub_ids else hub_ids[0])
 
-            if hub_x_user:
-                _hub = await self.db.hubs.find_one({"hub_id": hub_x_user['hub_id']})
+    async def update_user_photos(self, user_id: int, photos: Dict[str, str]) -> None:
+        """Saves the stored file names of the user's photo variants.
+
+        Args:
+            user_id: The user telegram id.
+            photos: Variant name mapped to the stored file name, and the photo's file_unique_id.
+        """
 
-                return Hub(**_hub)
+        _, hub_ids = await asyncio.gather(
+            self.db.users.update_one(
+                {"user_id": user_id},
+                {"$set": {"photos": photos, "updated_at": datetime.datetime.now()}}
+            ),
+            self._user_hub_ids(user_id)
+        )
 
-        return None
+        self._user_changed(user_id, hub_ids)
 
     async def update_user(self, user_id: int, values: UserUpdate) -> Union[User, None]:
         """Updates the user.
@@ -254,21 +847,44 @@ class MongoDB:
             User: The User object.
         """
 
-        await self.db.users.update_one(
-            {"user_id": user_id},
-            [{
-                "$set": {
-                    "about": values.about[:500],
-                    "age": values.age if values.age != "" else None,
-                    "working_name": sanitize_input(values.name)[:20],
-                    "updated_at": datetime.datetime.now()
-                }
-            }]
+        _user, hub_ids = await asyncio.gather(
+            self.db.users.find_one_and_update(
+                {"user_id": user_id},
+                [{
+                    "$set": {
+                        "about": values.about[:500],
+                        "age": values.age if values.age != "" else None,
+                        "working_name": sanitize_input(values.name)[:20],
+                        "updated_at": datetime.datetime.now()
+                    }
+                }],
+                return_document=ReturnDocument.AFTER
+            ),
+            self._user_hub_ids(user_id)
         )
 
-        _user = await self.db.users.find_one({"user_id": user_id})
+        self._user_changed(user_id, hub_ids)
 
         return User(**_user)
 
 
-database = MongoDB(uri=os.getenv('MONGODB_URI'), database=os.getenv('DATABASE_NAME'))
+def create_database(backend: str = STORAGE_BACKEND) -> Repository:
+    """Builds the storage selected by STORAGE_BACKEND."""
+
+    events = EventHub(create_broker())
+
+    if backend == "mongo":
+        return MongoDB(uri=MONGODB_URI, database=DATABASE_NAME, events=events, **MONGODB_CLIENT_OPTIONS)
+
+    if backend == "memory":
+        snapshot = MongoDB(uri=MONGODB_URI, database=DATABASE_NAME) if MEMORY_SNAPSHOT_FROM_MONGO else None
+
+        return InMemoryDatabase(events=events, snapshot=snapshot)
+
+    raise ValueError(f"Unknown storage backend {backend!r}, expected mongo or memory")
+
+
+database: Repository = create_database()
+
+if isinstance(database, MongoDB):
+    metrics.register_stats("current_user_cache", database.current_users.stats)
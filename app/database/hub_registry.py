@@ -0,0 +1,87 @@
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.models.hubs import Hub
+from app.settings import HUB_REGISTRY_OVERLAP, HUB_REGISTRY_REFRESH
+
+logger = logging.getLogger(__name__)
+
+
+class HubRegistry:
+    """A process-local copy of the hubs and hub_x_user collections.
+
+    There are few hubs and each user belongs to a handful of them, so both fit in memory. A user's memberships are
+    a bitmap over hub ordinals. refresh() re-reads all hubs, which picks up renames, and only the memberships created
+    since the previous refresh. Memberships are never deleted, so nothing has to be dropped.
+    """
+
+    def __init__(self, overlap: float = HUB_REGISTRY_OVERLAP) -> None:
+        self.overlap = overlap
+        self.hubs: Dict[int, Hub] = {}
+        self.refreshed_at: Optional[datetime.datetime] = None
+        self._ordinals: Dict[int, int] = {}
+        self._hub_ids: List[int] = []
+        self._memberships: Dict[int, int] = {}
+
+    def hub(self, hub_id: int) -> Optional[Hub]:
+        return self.hubs.get(hub_id)
+
+    def add_hub(self, hub: Hub) -> None:
+        self.hubs[hub.hub_id] = hub
+
+    def join(self, hub_id: int, user_id: int) -> None:
+        self._memberships[user_id] = self._memberships.get(user_id, 0) | 1 << self._ordinal(hub_id)
+
+    def is_member(self, hub_id: int, user_id: int) -> bool:
+        ordinal = self._ordinals.get(hub_id)
+
+        return ordinal is not None and bool(self._memberships.get(user_id, 0) >> ordinal & 1)
+
+    def user_hub_ids(self, user_id: int) -> List[int]:
+        """Returns the ids of the hubs the user belongs to in ascending order."""
+        bitmap = self._memberships.get(user_id, 0)
+
+        return sorted(hub_id for ordinal, hub_id in enumerate(self._hub_ids) if bitmap >> ordinal & 1)
+
+    def _ordinal(self, hub_id: int) -> int:
+        ordinal = self._ordinals.get(hub_id)
+
+        if ordinal is None:
+            ordinal = self._ordinals[hub_id] = len(self._hub_ids)
+            self._hub_ids.append(hub_id)
+
+        return ordinal
+
+    async def refresh(self, db: AsyncIOMotorDatabase) -> None:
+        """Loads everything on the first call, then the hubs and the memberships created since the last one."""
+
+        started_at = datetime.datetime.now()
+        membership_filter = {}
+
+        if self.refreshed_at is not None:
+            membership_filter = {"created_at": {"$gt": self.refreshed_at - datetime.timedelta(seconds=self.overlap)}}
+
+        async def load_memberships() -> None:
+            async for membership in db.hub_x_user.find(membership_filter, {"_id": 0, "hub_id": 1, "user_id": 1}):
+                self.join(membership['hub_id'], membership['user_id'])
+
+        hubs, _ = await asyncio.gather(
+            db.hubs.find({}, {"_id": 0, "hub_id": 1, "hub_nm": 1}).to_list(None), load_memberships())
+
+        self.hubs = {hub['hub_id']: Hub(**hub) for hub in hubs}
+        self.refreshed_at = started_at
+
+    async def run(self, db: AsyncIOMotorDatabase, interval: float = HUB_REGISTRY_REFRESH) -> None:
+        """Refreshes the registry every interval seconds until cancelled."""
+
+        while True:
+            await asyncio.sleep(interval)
+
+            try:
+                await self.refresh(db)
+            except Exception as e:
+                logger.warning("Could not refresh the hub registry: %s", e)
@@ -0,0 +1,106 @@
+import logging
+from typing import Any, Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "hubs": [
+        IndexModel([("hub_id", ASCENDING)], name="hub_id_unique", unique=True),
+    ],
+    "hub_x_user": [
+        IndexModel([("hub_id", ASCENDING), ("user_id", ASCENDING)], name="hub_id_user_id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("hub_id", ASCENDING)], name="user_id_hub_id"),
+        IndexModel([("hub_id", ASCENDING), ("created_at", ASCENDING)], name="hub_id_created_at"),
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+    ],
+    "matches": [
+        IndexModel([("first_user_id", ASCENDING), ("second_user_id", ASCENDING)],
+                   name="first_user_id_second_user_id_unique", unique=True),
+        IndexModel([("second_user_id", ASCENDING), ("first_user_id", ASCENDING)], name="second_user_id_first_user_id"),
+    ],
+    "mutual_matches": [
+        IndexModel([("user_id", ASCENDING), ("match_user_id", ASCENDING)], name="user_id_match_user_id_unique",
+                   unique=True),
+    ],
+}
+
+
+def find_collection_scans(explain: Any, path: str = "") -> List[str]:
+    """Walks an explain() output and collects every place a collection scan is planned.
+
+    Args:
+        explain: The explain command result or any nested part of it.
+        path: Location of ``explain`` inside the root document.
+
+    Returns:
+        List[str]: Paths of the plan stages that scan a whole collection.
+    """
+
+    scans: List[str] = []
+
+    if isinstance(explain, dict):
+        if explain.get("stage") == "COLLSCAN":
+            scans.append(path or "$")
+
+        # $lookup stages report their inner plans as counters only.
+        if explain.get("collectionScans", 0) > 0:
+            scans.append(path or "$")
+
+        for key, value in explain.items():
+            scans.extend(find_collection_scans(value, f"{path}.{key}" if path else key))
+    elif isinstance(explain, list):
+        for index, value in enumerate(explain):
+            scans.extend(find_collection_scans(value, f"{path}[{index}]"))
+
+    return scans
+
+
+class IndexManager:
+    """Declares and verifies the indexes the application queries rely on."""
+
+    def __init__(self, db: AsyncIOMotorDatabase, indexes: Dict[str, List[IndexModel]] = None) -> None:
+        self.db = db
+        self.indexes = indexes if indexes is not None else INDEXES
+
+    async def ensure(self) -> None:
+        """Creates missing indexes. Existing indexes with the same spec are left untouched."""
+
+        for collection, indexes in self.indexes.items():
+            try:
+                await self.db[collection].create_indexes(indexes)
+            except OperationFailure as e:
+                # Duplicates in legacy data must not prevent the application from starting.
+                logger.error("Could not create indexes on %s: %s", collection, e)
+
+    async def explain(self, command: Dict[str, Any]) -> Dict[str, Any]:
+        """Runs explain on a raw find, delete or aggregate command."""
+
+        return await self.db.command("explain", command, verbosity="executionStats")
+
+    async def verify(self, query_shapes: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+        """Explains every query shape and reports the ones planning a collection scan.
+
+        Args:
+            query_shapes: Query shape name mapped to the command to explain.
+
+        Returns:
+            Dict[str, List[str]]: Query shape name mapped to the offending plan stages.
+        """
+
+        failures: Dict[str, List[str]] = {}
+
+        for name, command in query_shapes.items():
+            scans = find_collection_scans(await self.explain(command))
+
+            if scans:
+                failures[name] = scans
+
+        return failures
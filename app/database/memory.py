@@ -0,0 +1,433 @@
+import asyncio
+import datetime
+import logging
+from bisect import bisect_right, insort
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+from app.database.repository import follow_feed_changes, publish_like, publish_member_joined, publish_profile_updated
+from app.models.events import Event, EventType
+from app.models.hubs import Hub
+from app.models.matches import LikeEdge, Matches, match_key
+from app.models.user import (TelegramUser, TelegramUserInfo, User, UserCurrent, UserUpdate, UsersFeedItem,
+                             UserWithLikes)
+from app.utils.cache import VersionCounter
+from app.utils.events import EventHub
+from app.utils.utils import photo_url, sanitize_input
+
+if TYPE_CHECKING:
+    from app.database.database import MongoDB
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryDatabase:
+    """Keeps users, hubs and likes in process memory, indexed for the queries the API makes.
+
+    Lets the HTTP layer be tested and load-tested without MongoDB. Loaded from a MongoDB snapshot at start,
+    it serves reads from memory and forwards every write to MongoDB before applying MongoDB's result here, so
+    nothing is lost on restart. The events of other workers' writes, which needs a shared event broker, make this
+    worker re-read the users and pairs they touched, and users or hubs it does not know yet are read on a miss.
+    """
+
+    def __init__(self, events: Optional[EventHub] = None, snapshot: Optional["MongoDB"] = None) -> None:
+        self.events = events if events is not None else EventHub()
+        self.snapshot = snapshot
+        self.hub_versions = VersionCounter()
+        self.viewer_versions = VersionCounter()
+        follow_feed_changes(self.events, self.hub_versions, self.viewer_versions)
+
+        self.users: Dict[int, User] = {}
+        self.created_at: Dict[int, datetime.datetime] = {}
+        self.updated_at: Dict[int, datetime.datetime] = {}
+        self.hubs: Dict[int, Hub] = {}
+        # Sorted member ids per hub, so feed pages are a bisect away, and sorted hub ids per user.
+        self.hub_members: Dict[int, List[int]] = {}
+        self.user_hubs: Dict[int, List[int]] = {}
+        self.joined_at: Dict[Tuple[int, int], datetime.datetime] = {}
+        # Pair documents keyed by (first_user_id, second_user_id), and the users each user has a pair with.
+        self.matches: Dict[Tuple[int, int], Matches] = {}
+        self.partners: Dict[int, Set[int]] = {}
+        self.mutual: Dict[int, Dict[int, datetime.datetime]] = {}
+        self._pulls: Set[asyncio.Task] = set()
+
+        if snapshot is not None:
+            self.events.listen(self._follow_snapshot)
+
+    async def start(self) -> None:
+        if self.snapshot is not None:
+            # Without other workers' events this copy would serve their users and likes stale until restart.
+            if not self.events.broker.shared:
+                raise RuntimeError("The MongoDB snapshot needs a shared event broker, set EVENT_BROKER=unix")
+
+            await self.snapshot.start()
+            await self.load(self.snapshot)
+
+    async def close(self) -> None:
+        for task in list(self._pulls):
+            task.cancel()
+
+        if self.snapshot is not None:
+            await self.snapshot.close()
+
+    async def load(self, source: "MongoDB") -> None:
+        """Copies users, hubs, memberships and likes from MongoDB."""
+
+        async for hub in source.db.hubs.find({}, {"_id": 0, "hub_id": 1, "hub_nm": 1}):
+            self.hubs[hub['hub_id']] = Hub(**hub)
+
+        async for user in source.db.users.find():
+            self._store_user(user)
+
+        async for row in source.db.hub_x_user.find():
+            self._add_member(row['hub_id'], row['user_id'], row.get('created_at') or datetime.datetime.now())
+
+        async for match in source.db.matches.find({"first_likes_second": {"$exists": True}}, {"_id": 0}):
+            self._store_match(Matches(**match))
+
+    def _store_user(self, user: Dict) -> None:
+        self.users[user['user_id']] = User(**user)
+        self.created_at[user['user_id']] = user.get('created_at') or datetime.datetime.now()
+        self.updated_at[user['user_id']] = user.get('updated_at') or self.created_at[user['user_id']]
+
+    def _follow_snapshot(self, channel: str, event: Event) -> None:
+        """Re-reads what another worker's write changed. Called for every event published by another worker."""
+
+        if event.type == EventType.like:
+            # Like events go to the liked user's channel, see publish_like.
+            pull = self._pull_matches(int(channel.partition(":")[2]), [event.data["id"]])
+        elif event.type in (EventType.profile_updated, EventType.member_joined):
+            pull = self._pull_user(event.data["id"])
+        else:
+            return
+
+        task = asyncio.ensure_future(pull)
+        self._pulls.add(task)
+        task.add_done_callback(self._pulled)
+
+    def _pulled(self, task: asyncio.Task) -> None:
+        self._pulls.discard(task)
+
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Could not re-read a change from MongoDB: %s", task.exception())
+
+    async def _pull_user(self, user_id: int) -> Union[User, None]:
+        """Replaces the user and their memberships by their MongoDB documents."""
+
+        user, memberships = await asyncio.gather(
+            self.snapshot.db.users.find_one({"user_id": user_id}),
+            self.snapshot.db.hub_x_user.find({"user_id": user_id}).to_list(None))
+
+        if user is None:
+            return None
+
+        self._store_user(user)
+
+        for row in memberships:
+            await self.get_hub(row['hub_id'])
+            self._add_member(row['hub_id'], user_id, row.get('created_at') or datetime.datetime.now())
+
+        # Pages cached while the read was in flight still show the old profile.
+        self.hub_versions.bump(*self.user_hubs.get(user_id, []))
+
+        return self.users[user_id]
+
+    async def add_hub(self, hub: Hub) -> None:
+        if self.snapshot is not None:
+            await self.snapshot.add_hub(hub)
+
+        self.hubs[hub.hub_id] = hub
+
+    def _add_member(self, hub_id: int, user_id: int, joined_at: datetime.datetime) -> bool:
+        if (hub_id, user_id) in self.joined_at:
+            return False
+
+        self.joined_at[(hub_id, user_id)] = joined_at
+        insort(self.hub_members.setdefault(hub_id, []), user_id)
+        insort(self.user_hubs.setdefault(user_id, []), hub_id)
+
+        return True
+
+    async def _pull_matches(self, user_id: int, other_user_ids: List[int]) -> None:
+        """Replaces the user's pairs with the given users by their MongoDB documents."""
+
+        pairs = [match_key(user_id, other_user_id)[:2] for other_user_id in other_user_ids]
+        query = {"$or": [{"first_user_id": first_user_id, "second_user_id": second_user_id}
+                         for first_user_id, second_user_id in pairs],
+                 "first_likes_second": {"$exists": True}}
+
+        async for match in self.snapshot.db.matches.find(query, {"_id": 0}):
+            self._store_match(Matches(**match))
+
+        self.viewer_versions.bump(user_id, *other_user_ids)
+
+    def _store_match(self, match: Matches) -> None:
+        self.matches[(match.first_user_id, match.second_user_id)] = match
+        self.partners.setdefault(match.first_user_id, set()).add(match.second_user_id)
+        self.partners.setdefault(match.second_user_id, set()).add(match.first_user_id)
+        self._sync_mutual(match.first_user_id, match.second_user_id,
+                          match.first_likes_second and match.second_likes_first, match.updated_at)
+
+    def like_edges(self, user_id: int) -> List[LikeEdge]:
+        edges: List[LikeEdge] = []
+
+        for other_user_id in self.partners.get(user_id, ()):
+            first_user_id, second_user_id, likes, liked = match_key(user_id, other_user_id)
+            match = self.matches[(first_user_id, second_user_id)]
+
+            edges.append(LikeEdge(user_id=other_user_id, like=getattr(match, likes),
+                                  likes_you=getattr(match, liked), updated_at=match.updated_at))
+
+        return edges
+
+    def like_state(self, user_id: int) -> Tuple[Set[int], Set[int]]:
+        edges = self.like_edges(user_id)
+
+        return {edge.user_id for edge in edges if edge.like}, {edge.user_id for edge in edges if edge.likes_you}
+
+    def _feed_item(self, user_id: int, like: Set[int], likes_you: Set[int]) -> UsersFeedItem:
+        """Shapes the user as MongoDB's feed projection does."""
+        user = self.users[user_id]
+
+        return UsersFeedItem(id=user_id, about=user.about, age=user.age, firstName=user.first_name,
+                             lastName=user.last_name, photo=photo_url(user.photos, "small"),
+                             nickname=user.username, workingName=user.working_name, like=user_id in like,
+                             likesYou=user_id in likes_you)
+
+    async def iter_users(self, user_id: int, hub_id: int, after: Optional[int] = None,
+                         limit: Optional[int] = None) -> AsyncIterator[UsersFeedItem]:
+        like, likes_you = self.like_state(user_id)
+        members = self.hub_members.get(hub_id, [])
+        yielded = 0
+
+        for index in range(bisect_right(members, after) if after is not None else 0, len(members)):
+            if limit is not None and yielded >= limit:
+                return
+
+            member_id = members[index]
+
+            if member_id == user_id or member_id not in self.users:
+                continue
+
+            yielded += 1
+
+            yield self._feed_item(member_id, like, likes_you)
+
+    async def all_users(self, user_id: int, hub_id: int, after: Optional[int] = None,
+                        limit: Optional[int] = None) -> List[UsersFeedItem]:
+        return [user async for user in self.iter_users(user_id, hub_id, after, limit)]
+
+    async def users_since(self, user_id: int, hub_id: int,
+                          since: datetime.datetime) -> Tuple[List[UsersFeedItem], List[LikeEdge]]:
+        edges = self.like_edges(user_id)
+        like = {edge.user_id for edge in edges if edge.like}
+        likes_you = {edge.user_id for edge in edges if edge.likes_you}
+
+        members = [
+            member_id for member_id in self.hub_members.get(hub_id, [])
+            if member_id != user_id and member_id in self.users
+            and (self.updated_at[member_id] > since or self.joined_at[(hub_id, member_id)] > since)
+        ]
+
+        return ([self._feed_item(member_id, like, likes_you) for member_id in members],
+                [edge for edge in edges if edge.updated_at > since])
+
+    async def update_or_create_user(self, telegram_user: TelegramUser,
+                                    telegram_user_info: TelegramUserInfo = None) -> User:
+        now = datetime.datetime.now()
+        current = self.users.get(telegram_user.id)
+        working_name = telegram_user.first_name + (f' {telegram_user.last_name}' if telegram_user.last_name else '')
+
+        if self.snapshot is not None:
+            user = await self.snapshot.update_or_create_user(telegram_user, telegram_user_info)
+        else:
+            user = User(
+                user_id=telegram_user.id,
+                first_name=telegram_user.first_name,
+                last_name=telegram_user.last_name,
+                username=telegram_user.username,
+                telegram_photo=telegram_user_info.photo,
+                photos=(telegram_user_info.photos or (current.photos if current else None))
+                if telegram_user_info.photo else None,
+                about=current.about if current and current.about else telegram_user_info.about or None,
+                age=current.age if current else None,
+                working_name=current.working_name if current and current.working_name else working_name
+            )
+
+        changed = user != current
+        self.users[user.user_id] = user
+        self.created_at.setdefault(user.user_id, now)
+
+        if changed:
+            self.updated_at[user.user_id] = now
+
+        hub = await self.get_hub(int(telegram_user.start_param)) if telegram_user.start_param else None
+
+        if hub and self._add_member(hub.hub_id, user.user_id, now):
+            publish_member_joined(self.events, user.user_id, hub.hub_id)
+
+        self._user_changed(user.user_id, publish=changed)
+
+        return user
+
+    def _user_changed(self, user_id: int, publish: bool = True) -> None:
+        hub_ids = self.user_hubs.get(user_id, [])
+        self.hub_versions.bump(*hub_ids)
+
+        if publish:
+            publish_profile_updated(self.events, user_id, hub_ids)
+
+    async def get_hub(self, hub_id: int) -> Union[Hub, None]:
+        if hub_id not in self.hubs and self.snapshot is not None:
+            hub = await self.snapshot.get_hub(hub_id)
+
+            if hub is not None:
+                self.hubs[hub_id] = hub
+
+        return self.hubs.get(hub_id)
+
+    async def get_user(self, user_id: int) -> Union[User, None]:
+        # A user who has just logged in through another worker may be ahead of its event.
+        if user_id not in self.users and self.snapshot is not None:
+            return await self._pull_user(user_id)
+
+        return self.users.get(user_id)
+
+    async def get_current_user(self, user_id: int, hub_id: Optional[int] = None) -> Union[UserCurrent, None]:
+        user = await self.get_user(user_id)
+
+        if user is None:
+            return None
+
+        hub = await self.get_user_hub(user_id, hub_id)
+
+        return UserCurrent(hub_id=hub.hub_id if hub else None, **user.model_dump())
+
+    async def get_user_hub(self, user_id: int, hub_id: Optional[int] = None) -> Union[Hub, None]:
+        hub_ids = self.user_hubs.get(user_id)
+
+        if not hub_ids:
+            return None
+
+        return self.hubs.get(hub_id if hub_id in hub_ids else hub_ids[0])
+
+    async def update_user(self, user_id: int, values: UserUpdate) -> Union[User, None]:
+        user = await self.get_user(user_id)
+
+        if user is None:
+            return None
+
+        if self.snapshot is not None:
+            self.users[user_id] = await self.snapshot.update_user(user_id, values)
+        else:
+            # Validated again, since the age may come in as a string.
+            self.users[user_id] = User(**{
+                **user.model_dump(),
+                "about": values.about[:500],
+                "age": values.age if values.age != "" else None,
+                "working_name": sanitize_input(values.name)[:20],
+            })
+
+        self.updated_at[user_id] = datetime.datetime.now()
+        self._user_changed(user_id)
+
+        return self.users[user_id]
+
+    async def update_user_photos(self, user_id: int, photos: Dict[str, str]) -> None:
+        if await self.get_user(user_id) is None:
+            return
+
+        if self.snapshot is not None:
+            await self.snapshot.update_user_photos(user_id, photos)
+
+        self.users[user_id] = self.users[user_id].model_copy(update={"photos": photos})
+        self.updated_at[user_id] = datetime.datetime.now()
+        self._user_changed(user_id)
+
+    def _set_like(self, user_id: int, liked_user_id: int, value: Optional[bool],
+                  now: datetime.datetime) -> Optional[Matches]:
+        """Sets the like flag to value, or flips it when value is None. Clearing a missing like stores nothing."""
+
+        first_user_id, second_user_id, likes, _ = match_key(user_id, liked_user_id)
+        match = self.matches.get((first_user_id, second_user_id))
+
+        if match is None:
+            if value is False:
+                return None
+
+            match = Matches(first_user_id=first_user_id, second_user_id=second_user_id, created_at=now, updated_at=now)
+            self._store_match(match)
+
+        setattr(match, likes, not getattr(match, likes) if value is None else value)
+        match.updated_at = now
+
+        return match
+
+    def _sync_mutual(self, first_user_id: int, second_user_id: int, is_mutual: bool,
+                     now: datetime.datetime) -> None:
+        for user_id, match_user_id in ((first_user_id, second_user_id), (second_user_id, first_user_id)):
+            if is_mutual:
+                self.mutual.setdefault(user_id, {}).setdefault(match_user_id, now)
+            else:
+                self.mutual.get(user_id, {}).pop(match_user_id, None)
+
+    async def like(self, first_user_id: int, second_user_id: int) -> bool:
+        now = datetime.datetime.now()
+        pair_first_user_id, pair_second_user_id, likes, liked = match_key(first_user_id, second_user_id)
+
+        if self.snapshot is not None:
+            await self.snapshot.like(first_user_id, second_user_id)
+            await self._pull_matches(first_user_id, [second_user_id])
+            match = self.matches[(pair_first_user_id, pair_second_user_id)]
+        else:
+            match = self._set_like(first_user_id, second_user_id, None, now)
+
+        self.viewer_versions.bump(first_user_id, second_user_id)
+
+        if getattr(match, liked):
+            self._sync_mutual(match.first_user_id, match.second_user_id, getattr(match, likes), now)
+
+        publish_like(self.events, first_user_id, second_user_id, getattr(match, likes), getattr(match, liked))
+
+        return getattr(match, likes) and getattr(match, liked)
+
+    async def like_many(self, user_id: int, operations: List[Tuple[int, bool]]) -> List[bool]:
+        now = datetime.datetime.now()
+
+        if self.snapshot is not None:
+            await self.snapshot.like_many(user_id, operations)
+            await self._pull_matches(user_id, [liked_user_id for liked_user_id, _ in operations])
+        else:
+            for liked_user_id, value in operations:
+                self._set_like(user_id, liked_user_id, value, now)
+
+        self.viewer_versions.bump(user_id, *[liked_user_id for liked_user_id, _ in operations])
+
+        mutual: List[bool] = []
+        final: Dict[int, Tuple[bool, bool]] = {}
+
+        for liked_user_id, _ in operations:
+            first_user_id, second_user_id, likes, liked = match_key(user_id, liked_user_id)
+            match = self.matches.get((first_user_id, second_user_id))
+
+            if match is None:
+                mutual.append(False)
+                continue
+
+            mutual.append(getattr(match, likes) and getattr(match, liked))
+            final[liked_user_id] = getattr(match, likes), getattr(match, liked)
+
+        for liked_user_id, (like, liked_back) in final.items():
+            if like or liked_back:
+                self._sync_mutual(*match_key(user_id, liked_user_id)[:2], like and liked_back, now)
+
+            publish_like(self.events, user_id, liked_user_id, like, liked_back)
+
+        return mutual
+
+    async def mutual_matches(self, user_id: int, after: Optional[int] = None,
+                             limit: Optional[int] = None) -> List[UserWithLikes]:
+        match_user_ids = sorted(match_user_id for match_user_id in self.mutual.get(user_id, {})
+                                if after is None or match_user_id > after)
+
+        return [UserWithLikes(**self.users[match_user_id].model_dump(), like=True, likesYou=True)
+                for match_user_id in match_user_ids[:limit] if match_user_id in self.users]
@@ -0,0 +1,173 @@
+"""One-off data migrations. Run before starting the new version:
+
+    python -m app.database.migrations
+"""
+import asyncio
+import datetime
+import logging
+import os
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from app.bot.photos import IMAGES_DIR, PHOTO_VARIANTS
+from app.database.database import database
+from app.models.matches import Matches, MutualMatch, match_key
+
+logger = logging.getLogger(__name__)
+
+
+LEGACY_MATCH_INDEXES = ("first_user_id_second_user_id",)
+PAIR_INDEX = "first_user_id_second_user_id_unique"
+LEGACY_FILTER = {"first_likes_second": {"$exists": False}, "second_likes_first": {"$exists": False}}
+
+
+async def drop_indexes(collection: AsyncIOMotorCollection, names: Iterable[str]) -> None:
+    """Drops the named indexes that exist."""
+
+    existing = await collection.index_information()
+
+    for name in names:
+        if name in existing:
+            await collection.drop_index(name)
+
+
+def pair_update(match: Matches) -> Dict[str, Any]:
+    """Builds the upsert merging a pair folded from legacy rows into its pair document.
+
+    Flags are only ever set, so running the migration again after a failure changes nothing.
+    """
+
+    likes = {flag: True for flag in ("first_likes_second", "second_likes_first") if getattr(match, flag)}
+
+    return {"$set": likes, "$setOnInsert": match.model_dump(exclude={"created_at", *likes}),
+            "$min": {"created_at": match.created_at}}
+
+
+async def migrate_matches(db: AsyncIOMotorDatabase) -> int:
+    """Folds directional like rows into one pair document per pair of users.
+
+    Rows written before the pair schema have no like flags. Duplicate rows collapse into one flag. The pair
+    documents are written before any legacy row is deleted, so an interrupted run loses nothing and can be repeated.
+
+    Returns:
+        int: Number of legacy rows migrated.
+    """
+
+    # The old non-unique index has the same keys as the new unique one and makes ensure() fail while it exists.
+    await drop_indexes(db.matches, LEGACY_MATCH_INDEXES)
+
+    pairs: Dict[Tuple[int, int], Matches] = {}
+    migrated = 0
+    now = datetime.datetime.now()
+
+    async for row in db.matches.find(LEGACY_FILTER):
+        first_user_id, second_user_id, likes, _ = match_key(row['first_user_id'], row['second_user_id'])
+        created_at = row.get('created_at') or now
+
+        match = pairs.setdefault((first_user_id, second_user_id), Matches(
+            first_user_id=first_user_id, second_user_id=second_user_id, created_at=created_at, updated_at=now))
+        setattr(match, likes, True)
+        match.created_at = min(match.created_at, created_at)
+        migrated += 1
+
+    if not migrated:
+        return 0
+
+    # A legacy row can share its keys with the pair document, which the unique index would reject. main()
+    # recreates it once the legacy rows are gone.
+    await drop_indexes(db.matches, [PAIR_INDEX])
+
+    await db.matches.bulk_write([
+        UpdateOne({"first_user_id": match.first_user_id, "second_user_id": match.second_user_id,
+                   "first_likes_second": {"$exists": True}}, pair_update(match), upsert=True)
+        for match in pairs.values()
+    ], ordered=False)
+    await db.matches.delete_many(LEGACY_FILTER)
+
+    return migrated
+
+
+async def migrate_mutual_matches(db: AsyncIOMotorDatabase) -> int:
+    """Fills mutual_matches from the pairs liked in both directions. Safe to run repeatedly.
+
+    Returns:
+        int: Number of mutual pairs.
+    """
+
+    requests = []
+
+    async for match in db.matches.find({"first_likes_second": True, "second_likes_first": True}):
+        created_at = match.get('updated_at') or datetime.datetime.now()
+
+        for user_id, match_user_id in ((match['first_user_id'], match['second_user_id']),
+                                       (match['second_user_id'], match['first_user_id'])):
+            requests.append(UpdateOne(
+                {"user_id": user_id, "match_user_id": match_user_id},
+                {"$setOnInsert": MutualMatch(user_id=user_id, match_user_id=match_user_id,
+                                             pair_version=match.get('version', 0),
+                                             created_at=created_at).model_dump()},
+                upsert=True))
+
+    if requests:
+        await db.mutual_matches.bulk_write(requests, ordered=False)
+
+    return len(requests) // 2
+
+
+def legacy_photos(telegram_photo: Optional[str], directory: str = IMAGES_DIR) -> Optional[Dict[str, str]]:
+    """Returns every variant pointing at the user's {telegram_photo}.jpg, downloaded before variants were stored.
+
+    None if the user has no photo or the file is not there.
+    """
+
+    if not telegram_photo:
+        return None
+
+    file_name = f'{telegram_photo}.jpg'
+
+    if not os.path.isfile(os.path.join(directory, file_name)):
+        return None
+
+    return {variant: file_name for variant in PHOTO_VARIANTS}
+
+
+async def migrate_photos(db: AsyncIOMotorDatabase, directory: str = IMAGES_DIR) -> int:
+    """Fills photos of users who have none yet from their legacy photo file. Safe to run repeatedly.
+
+    The variants are replaced by the next download, which happens on the user's next login.
+
+    Returns:
+        int: Number of users given photos.
+    """
+
+    requests = []
+
+    async for user in db.users.find({"photos": None, "telegram_photo": {"$nin": [None, ""]}},
+                                    {"_id": 0, "user_id": 1, "telegram_photo": 1}):
+        photos = legacy_photos(user['telegram_photo'], directory)
+
+        if photos is not None:
+            # Leaves photos stored by a download since the read alone.
+            requests.append(UpdateOne({"user_id": user['user_id'], "photos": None}, {"$set": {"photos": photos}}))
+
+    if requests:
+        await db.users.bulk_write(requests, ordered=False)
+
+    return len(requests)
+
+
+async def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+
+    logger.info("Migrated %s legacy like rows", await migrate_matches(database.db))
+    logger.info("Found %s mutual matches", await migrate_mutual_matches(database.db))
+    logger.info("Gave %s users their legacy photo", await migrate_photos(database.db))
+
+    await database.ensure_indexes()
+    await database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
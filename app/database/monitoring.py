@@ -0,0 +1,151 @@
+import json
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+from app.settings import MONGO_MAX_COMMANDS_PER_REQUEST, MONGO_QUERY_REPORT, MONGO_SLOW_QUERY_MS
+from app.utils.metrics import RequestTimings, current_timings
+
+logger = logging.getLogger(__name__)
+
+# Where each command keeps its filter.
+FILTER_FIELDS = {
+    "find": "filter",
+    "findAndModify": "query",
+    "count": "query",
+    "distinct": "query",
+}
+
+
+def value_shape(value: Any) -> Any:
+    """Replaces the values of a filter with "?" and keeps its field names and operators."""
+    if isinstance(value, dict):
+        return {key: value_shape(item) for key, item in value.items()}
+
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        shapes = []
+
+        # $or over many pairs has one shape however many pairs there are.
+        for shape in (value_shape(item) for item in value):
+            if shape not in shapes:
+                shapes.append(shape)
+
+        return shapes
+
+    return "?"
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Tuple[str, str]:
+    """Returns the collection of a command and its shape, e.g. ``find {"user_id": "?"}``."""
+    collection = command.get("collection") if command_name == "getMore" else command.get(command_name)
+    collection = collection if isinstance(collection, str) else ""
+
+    if command_name == "aggregate":
+        shape = [next(iter(stage)) for stage in command.get("pipeline", [])]
+    elif command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes") or [{}]
+        shape = value_shape(statements[0].get("q", {}))
+    elif command_name in FILTER_FIELDS:
+        shape = value_shape(command.get(FILTER_FIELDS[command_name], {}))
+    else:
+        return collection, command_name
+
+    return collection, f'{command_name} {json.dumps(shape, separators=(",", ":"))}'
+
+
+def documents_returned(reply: Dict[str, Any]) -> int:
+    cursor = reply.get("cursor")
+
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+
+    if "value" in reply:
+        return 1 if reply["value"] is not None else 0
+
+    if "values" in reply:
+        return len(reply["values"])
+
+    return int(reply.get("n", 0))
+
+
+class QueryReport:
+    """Query shapes each route produces, with their count, time and documents returned."""
+
+    def __init__(self) -> None:
+        self._routes: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, collection: str, shape: str, duration_ms: float, documents: int) -> None:
+        with self._lock:
+            stats = self._routes.setdefault(route, {}).setdefault(
+                f'{collection}.{shape}', {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "documents": 0})
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["documents"] += documents
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        with self._lock:
+            return {route: {shape: dict(stats) for shape, stats in shapes.items()}
+                    for route, shapes in sorted(self._routes.items())}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """Attributes every Mongo command to the request that issued it.
+
+    Adds each command to the db phase of the request, logs slow commands and requests issuing more than
+    max_commands, and optionally collects a QueryReport. Motor runs commands on executor threads but copies
+    the caller's context, so the current request is known here.
+    """
+
+    def __init__(self, slow_query_ms: float = MONGO_SLOW_QUERY_MS,
+                 max_commands: int = MONGO_MAX_COMMANDS_PER_REQUEST,
+                 report: Optional[QueryReport] = None) -> None:
+        self.slow_query_ms = slow_query_ms
+        self.max_commands = max_commands
+        self.report = report
+        self._started: Dict[int, Tuple[Optional[RequestTimings], str, str]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection, shape = command_shape(event.command_name, event.command)
+        self._started[event.request_id] = current_timings.get(), collection, shape
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event.request_id, event.duration_micros, documents_returned(event.reply))
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event.request_id, event.duration_micros, 0)
+
+    def _finished(self, request_id: int, duration_micros: int, documents: int) -> None:
+        timings, collection, shape = self._started.pop(request_id, (None, "", ""))
+        duration_ms = duration_micros / 1000
+        route = timings.route if timings is not None else "background"
+
+        if duration_ms >= self.slow_query_ms:
+            logger.warning("Slow Mongo command on %s: %s.%s took %.1f ms and returned %s documents",
+                           route, collection, shape, duration_ms, documents)
+
+        if self.report is not None:
+            self.report.record(route, collection, shape, duration_ms, documents)
+
+        if timings is None:
+            return
+
+        commands = timings.add_mongo_command(duration_ms / 1000, f'{collection}.{shape}')
+
+        # Logged once, when the request crosses the threshold.
+        if commands == self.max_commands + 1:
+            shapes = Counter(timings.mongo_shapes)
+
+            logger.warning("%s issued more than %s Mongo commands: %s", route, self.max_commands,
+                           ", ".join(f'{count} x {shape}' for shape, count in shapes.most_common()))
+
+
+query_report = QueryReport() if MONGO_QUERY_REPORT else None
@@ -0,0 +1,109 @@
+import datetime
+from typing import AsyncIterator, Dict, List, Optional, Protocol, Tuple, Union
+
+from app.models.events import Event, EventType
+from app.models.hubs import Hub
+from app.models.matches import LikeEdge
+from app.models.user import (TelegramUser, TelegramUserInfo, User, UserCurrent, UserUpdate, UsersFeedItem,
+                             UserWithLikes)
+from app.utils.cache import VersionCounter
+from app.utils.events import EventHub, hub_channel, user_channel
+
+
+class Repository(Protocol):
+    """Storage used by the API. Implemented by MongoDB and InMemoryDatabase, chosen by STORAGE_BACKEND."""
+
+    events: EventHub
+    hub_versions: VersionCounter
+    viewer_versions: VersionCounter
+
+    async def start(self) -> None:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+    def iter_users(self, user_id: int, hub_id: int, after: Optional[int] = None,
+                   limit: Optional[int] = None) -> AsyncIterator[UsersFeedItem]:
+        ...
+
+    async def all_users(self, user_id: int, hub_id: int, after: Optional[int] = None,
+                        limit: Optional[int] = None) -> List[UsersFeedItem]:
+        ...
+
+    async def users_since(self, user_id: int, hub_id: int,
+                          since: datetime.datetime) -> Tuple[List[UsersFeedItem], List[LikeEdge]]:
+        ...
+
+    async def update_or_create_user(self, telegram_user: TelegramUser,
+                                    telegram_user_info: TelegramUserInfo = None) -> User:
+        ...
+
+    async def add_hub(self, hub: Hub) -> None:
+        ...
+
+    async def get_hub(self, hub_id: int) -> Union[Hub, None]:
+        ...
+
+    async def get_user(self, user_id: int) -> Union[User, None]:
+        ...
+
+    async def get_current_user(self, user_id: int, hub_id: Optional[int] = None) -> Union[UserCurrent, None]:
+        ...
+
+    async def get_user_hub(self, user_id: int, hub_id: Optional[int] = None) -> Union[Hub, None]:
+        ...
+
+    async def update_user(self, user_id: int, values: UserUpdate) -> Union[User, None]:
+        ...
+
+    async def update_user_photos(self, user_id: int, photos: Dict[str, str]) -> None:
+        ...
+
+    async def like(self, first_user_id: int, second_user_id: int) -> bool:
+        ...
+
+    async def like_many(self, user_id: int, operations: List[Tuple[int, bool]]) -> List[bool]:
+        ...
+
+    async def mutual_matches(self, user_id: int, after: Optional[int] = None,
+                             limit: Optional[int] = None) -> List[UserWithLikes]:
+        ...
+
+
+def publish_like(events: EventHub, user_id: int, liked_user_id: int, like: bool, liked_back: bool) -> None:
+    """Tells the liked user about the like and both users about a mutual match starting or ending."""
+
+    events.publish(user_channel(liked_user_id), Event(type=EventType.like, data={"id": user_id, "like": like}))
+
+    if liked_back:
+        for recipient_id, match_user_id in ((user_id, liked_user_id), (liked_user_id, user_id)):
+            events.publish(user_channel(recipient_id),
+                           Event(type=EventType.mutual, data={"id": match_user_id, "mutual": like}))
+
+
+def publish_member_joined(events: EventHub, user_id: int, hub_id: int) -> None:
+    events.publish(hub_channel(hub_id), Event(type=EventType.member_joined, data={"id": user_id}))
+
+
+def follow_feed_changes(events: EventHub, hub_versions: VersionCounter, viewer_versions: VersionCounter) -> None:
+    """Bumps the feed versions on changes made by other workers, so this one stops serving its cached pages.
+
+    Hub events change the hub's feed; a like changes the flags both users see.
+    """
+
+    def changed(channel: str, event: Event) -> None:
+        # Channels are named by hub_channel and user_channel.
+        kind, _, key = channel.partition(":")
+
+        if kind == "hub":
+            hub_versions.bump(int(key))
+        elif event.type == EventType.like:
+            viewer_versions.bump(int(key), event.data["id"])
+
+    events.listen(changed)
+
+
+def publish_profile_updated(events: EventHub, user_id: int, hub_ids: List[int]) -> None:
+    for hub_id in hub_ids:
+        events.publish(hub_channel(hub_id), Event(type=EventType.profile_updated, data={"id": user_id}))
@@ -1,13 +1,62 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from aiogram.exceptions import TelegramRetryAfter
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware
 
-from .api import user, users, auth, like, static
+from .api import user, users, auth, like, matches, metrics, static, ws
+from .bot.bot import bot
+from .bot.scheduler import SchedulerOverloaded
+from .database.database import database
+from .utils.metrics import MetricsMiddleware, TimedJSONResponse
+
+
+async def stored_photos(user_id: int) -> Optional[Dict[str, str]]:
+    user = await database.get_user(user_id)
+
+    return user.photos if user else None
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Clients are created here rather than at import, so each worker opens its own pools after the fork and
+    # is warm before it accepts requests.
+    await asyncio.gather(database.start(), bot.start(), database.events.start())
+
+    bot.photos.on_stored = database.update_user_photos
+    bot.photos.load_stored = stored_photos
+
+    yield
+
+    # In-flight requests have been drained by the server at this point.
+    await database.events.close()
+    # Waits for the photo downloads, which still save their variants, so the database closes last.
+    await bot.close()
+    await database.close()
+
 
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse,
     docs_url="/api/docs",
     openapi_url="/api/openapi.json",
 )
 
+
+@app.exception_handler(SchedulerOverloaded)
+async def telegram_overloaded(_request: Request, _exc: SchedulerOverloaded):
+    return JSONResponse(status_code=503, content={"detail": "Telegram is busy"}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(TelegramRetryAfter)
+async def telegram_flood_wait(_request: Request, exc: TelegramRetryAfter):
+    return JSONResponse(status_code=503, content={"detail": "Telegram is busy"},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+
 origins = [
     "http://localhost:4200",
 ]
@@ -18,12 +67,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 # Including API routers
 app.include_router(user.router, prefix="/user")
 app.include_router(users.router, prefix="/users")
 app.include_router(auth.router, prefix="/auth")
 app.include_router(like.router, prefix="/like")
+app.include_router(matches.router, prefix="/matches")
 app.include_router(static.router, prefix="/static")
+app.include_router(ws.router, prefix="/ws")
+app.include_router(metrics.router, prefix="/metrics")
 # app.include_router(settings.router, prefix="/settings", tags=["settings"])
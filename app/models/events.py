@@ -0,0 +1,17 @@
+from enum import Enum
+from typing import Any, Dict
+
+from pydantic import BaseModel
+
+
+class EventType(str, Enum):
+    like = "like"
+    mutual = "mutual"
+    profile_updated = "profile_updated"
+    member_joined = "member_joined"
+
+
+class Event(BaseModel):
+    """A message pushed to connected clients over /ws."""
+    type: EventType
+    data: Dict[str, Any]
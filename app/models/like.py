@@ -1,5 +1,33 @@
-from pydantic import BaseModel
+from enum import Enum
+from typing import List
+
+from pydantic import BaseModel, Field, RootModel
+
+LIKE_BATCH_MAX_OPERATIONS = 100
 
 
 class LikeResponse(BaseModel):
     mutual: bool
+
+
+class LikeAction(str, Enum):
+    like = "like"
+    unlike = "unlike"
+
+
+class LikeOperation(BaseModel):
+    id: int
+    action: LikeAction
+
+
+class LikeBatchRequest(BaseModel):
+    operations: List[LikeOperation] = Field(max_length=LIKE_BATCH_MAX_OPERATIONS)
+
+
+class LikeBatchResponseItem(BaseModel):
+    id: int
+    mutual: bool
+
+
+class LikeBatchResponse(RootModel):
+    root: List[LikeBatchResponseItem]
@@ -1,9 +1,49 @@
 from datetime import datetime
+from typing import Optional, Tuple
 
 from pydantic import BaseModel
 
 
 class Matches(BaseModel):
+    """Like state of a pair of users, stored once per pair with first_user_id < second_user_id."""
     first_user_id: int
     second_user_id: int
+    first_likes_second: bool = False
+    second_likes_first: bool = False
+    # Incremented by every write to the pair, in the order the server applied them.
+    version: int = 0
     created_at: datetime
+    updated_at: datetime
+
+
+class MutualMatch(BaseModel):
+    """A mutual like as seen by user_id. Every pair that was ever mutual is stored once per user.
+
+    Ended matches are kept with mutual unset, so a late write of an older pair version cannot bring them back.
+    """
+    user_id: int
+    match_user_id: int
+    mutual: bool = True
+    pair_version: int = 0
+    created_at: datetime
+
+
+class LikeEdge(BaseModel):
+    """Like flags between a user and another user, as seen by the former."""
+    user_id: int
+    like: bool
+    likes_you: bool
+    updated_at: Optional[datetime] = None
+
+
+def match_key(user_id: int, liked_user_id: int) -> Tuple[int, int, str, str]:
+    """Returns the pair key of a like and the flag fields of both directions.
+
+    Returns:
+        Tuple[int, int, str, str]: first_user_id, second_user_id, the like's own flag and the reverse flag.
+    """
+
+    if user_id <= liked_user_id:
+        return user_id, liked_user_id, "first_likes_second", "second_likes_first"
+
+    return liked_user_id, user_id, "second_likes_first", "first_likes_second"
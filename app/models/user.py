@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, List, Union
+from typing import Dict, Optional, List, TypedDict, Union
 
 from pydantic import BaseModel, RootModel
 
@@ -12,6 +12,7 @@ class User(BaseModel):
     last_name: Optional[str] = None
     username: str
     telegram_photo: Optional[str] = None
+    photos: Optional[Dict[str, str]] = None
     about: Optional[str] = None
     age: Optional[int] = None
     working_name: Optional[str] = None
@@ -61,6 +62,7 @@ class TelegramUser(BaseModel):
 class TelegramUserInfo(BaseModel):
     about: Optional[str] = None
     photo: Optional[str] = None
+    photos: Optional[Dict[str, str]] = None
 
 
 class UsersResponseItem(BaseModel):
@@ -76,5 +78,38 @@ class UsersResponseItem(BaseModel):
     workingName: str
 
 
+class UsersFeedItem(TypedDict):
+    """A UsersResponseItem shaped by the storage, serialized as is without building models."""
+
+    id: int
+    about: Optional[str]
+    age: Optional[int]
+    firstName: str
+    lastName: Optional[str]
+    photo: Optional[str]
+    nickname: str
+    workingName: str
+    like: bool
+    likesYou: bool
+
+
 class UsersResponse(RootModel):
     root: List[UsersResponseItem]
+
+
+class UsersPageResponse(BaseModel):
+    items: List[UsersResponseItem]
+    next: Optional[str] = None
+    sync: Optional[str] = None
+
+
+class UsersLikeItem(BaseModel):
+    id: int
+    like: bool
+    likesYou: bool
+
+
+class UsersDeltaResponse(BaseModel):
+    items: List[UsersResponseItem]
+    likes: List[UsersLikeItem]
+    sync: str
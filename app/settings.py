@@ -0,0 +1,71 @@
+import os
+
+# "mongo", or "memory" to keep everything in the worker, see app/database/memory.py.
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mongo')
+# With the memory backend, copies MongoDB into memory at start, serves reads from it and forwards writes to MongoDB.
+MEMORY_SNAPSHOT_FROM_MONGO = os.getenv('MEMORY_SNAPSHOT_FROM_MONGO', '').lower() in ('1', 'true', 'yes')
+
+MONGODB_URI = os.getenv('MONGODB_URI')
+DATABASE_NAME = os.getenv('DATABASE_NAME')
+# Every gunicorn worker has its own pool, so the server sees up to workers * MONGODB_MAX_POOL_SIZE connections.
+MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', 50))
+MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', 5))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', 300000))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', 5000))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 2000))
+
+MONGODB_CLIENT_OPTIONS = {
+    "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+    "minPoolSize": MONGODB_MIN_POOL_SIZE,
+    "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+    "connectTimeoutMS": MONGODB_CONNECT_TIMEOUT_MS,
+    "serverSelectionTimeoutMS": MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+    "waitQueueTimeoutMS": MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+}
+
+MONGO_SLOW_QUERY_MS = float(os.getenv('MONGO_SLOW_QUERY_MS', 100))
+# More commands than this in one request usually means a query issued per item or a chain of lookups.
+MONGO_MAX_COMMANDS_PER_REQUEST = int(os.getenv('MONGO_MAX_COMMANDS_PER_REQUEST', 5))
+# Collects the per-route query shape report served by GET /metrics/queries. Meant for development.
+MONGO_QUERY_REPORT = os.getenv('MONGO_QUERY_REPORT', '').lower() in ('1', 'true', 'yes')
+
+CURRENT_USER_CACHE_TTL = float(os.getenv('CURRENT_USER_CACHE_TTL', 30))
+CURRENT_USER_CACHE_SIZE = int(os.getenv('CURRENT_USER_CACHE_SIZE', 10000))
+HUB_CACHE_TTL = float(os.getenv('HUB_CACHE_TTL', 300))
+HUB_REGISTRY_REFRESH = float(os.getenv('HUB_REGISTRY_REFRESH', 30))
+# Memberships are re-read from this far before the last refresh, covering in-flight writes and clock skew.
+HUB_REGISTRY_OVERLAP = float(os.getenv('HUB_REGISTRY_OVERLAP', 5))
+
+BOT_TOKEN = os.getenv('BOT_TOKEN')
+TELEGRAM_TIMEOUT = float(os.getenv('TELEGRAM_TIMEOUT', 10))
+TELEGRAM_RATE_LIMIT = float(os.getenv('TELEGRAM_RATE_LIMIT', 30))
+TELEGRAM_BURST = int(os.getenv('TELEGRAM_BURST', 30))
+TELEGRAM_MAX_QUEUE = int(os.getenv('TELEGRAM_MAX_QUEUE', 1000))
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', 3))
+USER_INFO_FRESH_TTL = float(os.getenv('USER_INFO_FRESH_TTL', 300))
+USER_INFO_STALE_TTL = float(os.getenv('USER_INFO_STALE_TTL', 86400))
+USER_INFO_CACHE_SIZE = int(os.getenv('USER_INFO_CACHE_SIZE', 10000))
+PHOTO_DOWNLOAD_CONCURRENCY = int(os.getenv('PHOTO_DOWNLOAD_CONCURRENCY', 4))
+# How long shutdown waits for the downloads in flight before cancelling them.
+PHOTO_SHUTDOWN_TIMEOUT = float(os.getenv('PHOTO_SHUTDOWN_TIMEOUT', 10))
+
+JWT_SECRET = os.getenv('JWT_SECRET')
+ALGORITHM = os.getenv('ALGORITHM')
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', 60))
+# initData older than this is rejected; the Mini App gets fresh initData every time it is opened.
+INIT_DATA_MAX_AGE = int(os.getenv('INIT_DATA_MAX_AGE', 24 * 60 * 60))
+# Verified access tokens and initData kept per worker, so repeated requests skip the signature checks.
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 10000))
+
+FEED_CACHE_TTL = float(os.getenv('FEED_CACHE_TTL', 60))
+FEED_CACHE_SIZE = int(os.getenv('FEED_CACHE_SIZE', 5000))
+# Sync tokens point this far before the read started, covering in-flight writes and clock skew between workers.
+SYNC_OVERLAP = float(os.getenv('SYNC_OVERLAP', 5))
+STATIC_CACHE_BYTES = int(os.getenv('STATIC_CACHE_BYTES', 32 * 1024 * 1024))
+STATIC_CACHE_ITEM_BYTES = int(os.getenv('STATIC_CACHE_ITEM_BYTES', 256 * 1024))
+
+# "unix" shares events between the workers of one host, "local" is for a single worker, see README.
+EVENT_BROKER = os.getenv('EVENT_BROKER', 'unix')
+EVENT_BROKER_DIR = os.getenv('EVENT_BROKER_DIR', '/tmp/campfire-events')
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', 100))
@@ -1,6 +1,10 @@
+import os
+
 import pytest
 from httpx import AsyncClient
+from pymongo import monitoring
 
+from app.database.database import MongoDB
 from app.main import app
 
 
@@ -14,3 +18,34 @@ async def client():
     async with AsyncClient(app=app, base_url="http://test") as client:
         print("Client is ready")
         yield client
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+@pytest.fixture
+async def scratch_database():
+    """A MongoDB instance on a throwaway database that records the name of every command it sends."""
+    counter = CommandCounter()
+    database = MongoDB(uri=os.getenv('MONGODB_URI'), database=f"{os.getenv('DATABASE_NAME')}_test",
+                       event_listeners=[counter])
+    database.counter = counter
+
+    await database.cluster.drop_database(database.db.name)
+    await database.ensure_indexes()
+
+    yield database
+
+    await database.cluster.drop_database(database.db.name)
+    await database.close()
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.bot import bot as bot_module
+from app.bot.bot import TelegramBot
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_chat(self, user_id):
+        self.calls += 1
+        await asyncio.sleep(0)
+
+        return SimpleNamespace(bio=f'bio {self.calls}', photo=None)
+
+
+@pytest.fixture
+def telegram_bot():
+    telegram_bot = TelegramBot(token=bot_module.BOT_TOKEN)
+    telegram_bot.bot = FakeBot()
+
+    return telegram_bot
+
+
+@pytest.mark.anyio
+async def test_concurrent_user_info_calls_share_one_request(telegram_bot):
+    results = await asyncio.gather(*[telegram_bot.load_user_info('1') for _ in range(5)])
+
+    assert telegram_bot.bot.calls == 1
+    assert {result.about for result in results} == {'bio 1'}
+
+    await telegram_bot.load_user_info('1')
+
+    assert telegram_bot.bot.calls == 1
+
+
+@pytest.mark.anyio
+async def test_stale_user_info_is_served_while_refreshing(telegram_bot, monkeypatch):
+    await telegram_bot.load_user_info('1')
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + bot_module.USER_INFO_FRESH_TTL + 1)
+
+    stale = await telegram_bot.load_user_info('1')
+    await asyncio.sleep(0.01)
+    fresh = await telegram_bot.load_user_info('1')
+
+    assert stale.about == 'bio 1'
+    assert fresh.about == 'bio 2'
+
+
+@pytest.mark.anyio
+async def test_bot_session_is_created_on_first_use():
+    telegram_bot = TelegramBot(token=bot_module.BOT_TOKEN, timeout=3)
+
+    assert telegram_bot._bot is None
+
+    assert telegram_bot.bot.session.timeout == 3
+    assert telegram_bot.photos.bot is telegram_bot.bot
+
+    await telegram_bot.close()
+
+    assert telegram_bot._bot is None
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+
+from app.utils.cache import SingleFlight, TTLCache, VerifiedCache
+
+
+def test_ttl_cache_counts_hits_and_misses():
+    cache = TTLCache(ttl=60)
+
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    cache = TTLCache(ttl=10)
+    cache.set("key", "value")
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set(1, "one")
+    cache.set(2, "two")
+    cache.get(1)
+    cache.set(3, "three")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "one"
+    assert cache.get(3) == "three"
+
+
+def test_ttl_cache_invalidates_tag():
+    cache = TTLCache(ttl=60)
+    cache.set((1, None), "hub none", tag=1)
+    cache.set((1, 5), "hub 5", tag=1)
+    cache.set((2, 5), "other user", tag=2)
+
+    cache.invalidate_tag(1)
+
+    assert cache.get((1, None)) is None
+    assert cache.get((1, 5)) is None
+    assert cache.get((2, 5)) == "other user"
+
+
+def test_verified_cache_skips_repeated_verification():
+    cache = VerifiedCache()
+    calls = []
+
+    def verify(credential):
+        calls.append(credential)
+
+        return credential.upper(), time.time() + 60
+
+    assert cache.verify("token", verify) == "TOKEN"
+    assert cache.verify("token", verify) == "TOKEN"
+    assert cache.verify("other", verify) == "OTHER"
+
+    assert calls == ["token", "other"]
+    assert cache.stats()["hits"] == 1
+    assert 0 < cache.stats()["saved_cpu_seconds"] <= cache.stats()["verify_cpu_seconds"]
+
+
+def test_verified_cache_expires_at_credential_deadline(monkeypatch):
+    cache = VerifiedCache()
+    now = time.time()
+    cache.verify("token", lambda credential: ("claims", now + 10))
+
+    def reject(credential):
+        raise ValueError("Expired")
+
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+
+    with pytest.raises(ValueError):
+        cache.verify("token", reject)
+
+    assert len(cache) == 0
+
+
+def test_verified_cache_is_bounded():
+    cache = VerifiedCache(maxsize=2)
+
+    for credential in ("a", "b", "a", "c"):
+        cache.verify(credential, lambda c: (c, time.time() + 60))
+
+    assert len(cache) == 2
+    assert cache.misses == 3
+    assert cache.verify("a", lambda c: ("fresh", time.time() + 60)) == "a"
+
+
+@pytest.mark.anyio
+async def test_single_flight_coalesces_calls():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+
+        return calls
+
+    first = asyncio.ensure_future(flight.run("key", load))
+    second = asyncio.ensure_future(flight.run("key", load))
+    await asyncio.sleep(0)
+
+    assert "key" in flight
+
+    release.set()
+
+    assert await first == await second == 1
+    assert "key" not in flight
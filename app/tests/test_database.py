@@ -0,0 +1,46 @@
+import pytest
+
+from app.database.database import MongoDB
+from app.database.hub_registry import HubRegistry
+from app.models.hubs import Hub
+
+
+@pytest.mark.anyio
+async def test_client_is_created_on_first_use():
+    database = MongoDB(uri="mongodb://localhost:27017", database="campfire_test", maxPoolSize=7)
+
+    assert database._cluster is None
+
+    assert database.db.name == "campfire_test"
+    assert database.cluster.options.pool_options.max_pool_size == 7
+    assert database.indexes.db is database.db
+
+    await database.close()
+
+    assert database._cluster is None
+
+
+def test_hub_registry_membership_bitmap():
+    registry = HubRegistry()
+
+    for hub_id, user_id in ((9, 1), (7, 1), (7, 2), (9, 1)):
+        registry.join(hub_id, user_id)
+
+    assert registry.user_hub_ids(1) == [7, 9]
+    assert registry.user_hub_ids(2) == [7]
+    assert registry.user_hub_ids(3) == []
+    assert registry.is_member(7, 2) and not registry.is_member(9, 2) and not registry.is_member(8, 2)
+
+
+@pytest.mark.anyio
+async def test_hub_resolution_from_registry():
+    database = MongoDB(uri="mongodb://localhost:27017", database="campfire_test")
+    database.registry.add_hub(Hub(hub_id=7, hub_nm="Seven"))
+    database.registry.add_hub(Hub(hub_id=9, hub_nm="Nine"))
+    database.registry.join(9, 1)
+    database.registry.join(7, 1)
+
+    assert (await database.get_user_hub(1)).hub_id == 7
+    assert (await database.get_user_hub(1, 9)).hub_nm == "Nine"
+    # Answered from memory, so the client was never even created.
+    assert database._cluster is None
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.api.auth import create_access_token
+from app.database.database import database
+from app.database.memory import InMemoryDatabase
+from app.database.repository import publish_like
+from app.main import app
+from app.models.events import Event, EventType
+from app.models.hubs import Hub
+from app.models.user import TelegramUser, TelegramUserInfo, UserCurrent
+from app.utils.events import EventHub, UnixSocketBroker, create_broker, hub_channel, user_channel
+
+
+def like_event(user_id: int) -> Event:
+    return Event(type=EventType.like, data={"id": user_id, "like": True})
+
+
+@pytest.mark.anyio
+async def test_event_hub_delivers_to_channel_subscribers():
+    hub = EventHub()
+
+    with hub.subscribe(user_channel(1), hub_channel(7)) as subscription:
+        hub.publish(user_channel(1), like_event(2))
+        hub.publish(user_channel(2), like_event(1))
+        hub.publish(hub_channel(7), Event(type=EventType.profile_updated, data={"id": 3}))
+
+        assert subscription.queue.qsize() == 2
+        assert Event.model_validate_json(subscription.queue.get_nowait()) == like_event(2)
+
+    # Without subscribers a single worker does not even encode the event.
+    hub.publish(user_channel(1), like_event(2))
+
+    assert hub.published == 2
+
+
+@pytest.mark.anyio
+async def test_event_hub_marks_slow_subscribers():
+    hub = EventHub(queue_size=2)
+
+    with hub.subscribe(user_channel(1)) as subscription:
+        for user_id in range(3):
+            hub.publish(user_channel(1), like_event(user_id))
+
+    assert subscription.overflowed
+    assert subscription.queue.qsize() == 2
+
+
+@pytest.mark.anyio
+async def test_unix_socket_broker_shares_events(tmp_path):
+    first, second = (EventHub(UnixSocketBroker(str(tmp_path), name=name)) for name in ("first", "second"))
+
+    await first.start()
+    await second.start()
+
+    try:
+        with second.subscribe(user_channel(1)) as subscription:
+            first.publish(user_channel(1), like_event(2))
+
+            message = await asyncio.wait_for(subscription.queue.get(), 1)
+
+        assert Event.model_validate_json(message) == like_event(2)
+    finally:
+        await first.close()
+        await second.close()
+
+
+def test_brokers():
+    # Workers must see each other's changes unless a single one is configured explicitly.
+    assert create_broker().shared is True
+    assert create_broker("local").shared is False
+
+    with pytest.raises(ValueError):
+        create_broker("redis")
+
+
+def test_publish_mutual_like():
+    hub = EventHub()
+
+    with hub.subscribe(user_channel(1)) as first, hub.subscribe(user_channel(2)) as second:
+        publish_like(hub, 1, 2, True, True)
+
+        assert [Event.model_validate_json(first.queue.get_nowait()).type] == [EventType.mutual]
+        assert [Event.model_validate_json(second.queue.get_nowait()).type for _ in range(2)] == [
+            EventType.like, EventType.mutual]
+
+
+@pytest.fixture
+def current_user(monkeypatch):
+    async def get_current_user(user_id, hub_id=None):
+        return UserCurrent(user_id=user_id, hub_id=hub_id, first_name="first", username="user")
+
+    monkeypatch.setattr(database, "get_current_user", get_current_user)
+
+
+def test_ws_pushes_events(current_user):
+    token = create_access_token({"sub": "1", "hub": 7})
+
+    with TestClient(app).websocket_connect(f"/ws?token={token}") as websocket:
+        # Published on the server loop, which is where MongoDB.like and update_user publish from.
+        websocket.portal.call(database.events.publish, hub_channel(7),
+                              Event(type=EventType.profile_updated, data={"id": 2}))
+
+        assert websocket.receive_json() == {"type": "profile_updated", "data": {"id": 2}}
+
+
+def test_ws_rejects_invalid_token(current_user):
+    with pytest.raises(WebSocketDisconnect) as e:
+        with TestClient(app).websocket_connect("/ws?token=invalid") as websocket:
+            websocket.receive_json()
+
+    assert e.value.code == 1008
+
+
+@pytest.mark.anyio
+async def test_other_workers_invalidate_feed_versions(tmp_path):
+    first, second = (InMemoryDatabase(EventHub(UnixSocketBroker(str(tmp_path), name=name)))
+                     for name in ("first", "second"))
+
+    await first.events.start()
+    await second.events.start()
+
+    try:
+        await first.add_hub(Hub(hub_id=7, hub_nm="Hub"))
+        await second.add_hub(Hub(hub_id=7, hub_nm="Hub"))
+
+        for user_id in (1, 2):
+            await first.update_or_create_user(
+                TelegramUser(id=user_id, first_name="First", last_name="Last", username=f"user{user_id}",
+                             language_code="en", start_param=7), TelegramUserInfo())
+
+        await first.like(1, 2)
+
+        # The joins and the like were handled by the first worker only.
+        for _ in range(100):
+            if second.viewer_versions.get(2) and second.hub_versions.get(7) >= 2:
+                break
+
+            await asyncio.sleep(0.01)
+
+        assert second.hub_versions.get(7) >= 2
+        assert second.viewer_versions.get(1) == second.viewer_versions.get(2) == 1
+    finally:
+        await first.events.close()
+        await second.events.close()
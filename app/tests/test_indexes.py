@@ -0,0 +1,32 @@
+import pytest
+
+from app.database.database import MongoDB
+from app.database.indexes import find_collection_scans
+
+
+def test_find_collection_scans():
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_id_unique"}}
+        },
+        "stages": [
+            {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}},
+            {"$lookup": {"from": "matches"}, "collectionScans": 3, "indexesUsed": []},
+        ]
+    }
+
+    assert find_collection_scans(explain) == [
+        "stages[0].$cursor.queryPlanner.winningPlan",
+        "stages[1]",
+    ]
+
+
+def test_find_collection_scans_index_only():
+    explain = {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}
+
+    assert find_collection_scans(explain) == []
+
+
+@pytest.mark.anyio
+async def test_query_plans_use_indexes(scratch_database: MongoDB):
+    assert await scratch_database.verify_indexes() == {}
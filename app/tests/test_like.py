@@ -0,0 +1,104 @@
+import asyncio
+import datetime
+
+import pytest
+
+from app.database.database import MongoDB
+from app.database.migrations import pair_update
+from app.models.matches import Matches, match_key
+
+
+def test_match_key():
+    assert match_key(1, 2) == (1, 2, "first_likes_second", "second_likes_first")
+    assert match_key(2, 1) == (1, 2, "second_likes_first", "first_likes_second")
+
+
+def test_legacy_pairs_merge_into_pair_documents():
+    created_at = datetime.datetime(2024, 1, 1)
+    update = pair_update(Matches(first_user_id=1, second_user_id=2, first_likes_second=True,
+                                 created_at=created_at, updated_at=created_at))
+
+    # Re-running only sets flags again; the reverse flag is only written when the document is created.
+    assert update["$set"] == {"first_likes_second": True}
+    assert update["$setOnInsert"]["second_likes_first"] is False
+    assert "first_likes_second" not in update["$setOnInsert"]
+    assert update["$min"] == {"created_at": created_at}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("toggles", [20, 21])
+async def test_parallel_like_toggles(scratch_database: MongoDB, toggles: int):
+    scratch_database.counter.commands.clear()
+
+    await asyncio.gather(*[scratch_database.like(1, 2) for _ in range(toggles)])
+
+    # Every toggle is exactly one round-trip.
+    assert scratch_database.counter.commands == ["findAndModify"] * toggles
+
+    assert await scratch_database.db.matches.count_documents({}) == 1
+    assert (await scratch_database.like_state(1))[0] == ({2} if toggles % 2 else set())
+
+
+@pytest.mark.anyio
+async def test_mutual_like(scratch_database: MongoDB):
+    assert await scratch_database.like(2, 1) is False
+    assert await scratch_database.like(1, 2) is True
+    assert await scratch_database.like(1, 2) is False
+    assert await scratch_database.like_state(2) == ({1}, set())
+
+
+@pytest.mark.anyio
+async def test_like_batch(scratch_database: MongoDB):
+    await scratch_database.like(2, 1)
+    await scratch_database.like(3, 1)
+    scratch_database.counter.commands.clear()
+
+    mutual = await scratch_database.like_many(1, [(2, True), (3, True), (3, False), (4, False), (5, True)])
+
+    assert mutual == [True, False, False, False, False]
+    assert scratch_database.counter.commands == ["update", "find"]
+    assert await scratch_database.like_state(1) == ({2, 5}, {2, 3})
+    assert await scratch_database.db.matches.count_documents({}) == 3
+
+
+@pytest.mark.anyio
+async def test_mutual_matches_are_maintained(scratch_database: MongoDB):
+    await scratch_database.db.users.insert_many([
+        {"user_id": user_id, "first_name": f"User {user_id}", "username": f"user{user_id}",
+         "working_name": f"User {user_id}"}
+        for user_id in (1, 2, 3)
+    ])
+
+    await scratch_database.like(1, 2)
+    await scratch_database.like(2, 1)
+    await scratch_database.like_many(3, [(1, True)])
+    await scratch_database.like_many(1, [(3, True)])
+
+    assert [user.user_id for user in await scratch_database.mutual_matches(1)] == [2, 3]
+    assert [user.user_id for user in await scratch_database.mutual_matches(1, after=2, limit=1)] == [3]
+    assert [user.user_id for user in await scratch_database.mutual_matches(2)] == [1]
+
+    await scratch_database.like(2, 1)
+    await scratch_database.like_many(3, [(1, False)])
+
+    assert await scratch_database.mutual_matches(1) == []
+    assert await scratch_database.db.mutual_matches.count_documents({"mutual": True}) == 0
+
+
+@pytest.mark.anyio
+async def test_stale_mutual_sync_is_ignored(scratch_database: MongoDB):
+    await scratch_database.db.users.insert_many([
+        {"user_id": user_id, "first_name": f"User {user_id}", "username": f"user{user_id}",
+         "working_name": f"User {user_id}"}
+        for user_id in (1, 2)
+    ])
+
+    # A like then unlike double tap whose mutual_matches writes arrive in reverse order.
+    await scratch_database._sync_mutual_matches({(1, 2): (False, 3)})
+    await scratch_database._sync_mutual_matches({(1, 2): (True, 2)})
+
+    assert await scratch_database.mutual_matches(1) == []
+
+    await scratch_database._sync_mutual_matches({(1, 2): (True, 4)})
+
+    assert [user.user_id for user in await scratch_database.mutual_matches(2)] == [1]
@@ -0,0 +1,44 @@
+import pytest
+
+from app.benchmarks.load import check_scratch, compare, generate, percentile
+from app.database.database import MongoDB
+from app.database.memory import InMemoryDatabase
+
+
+def test_percentile():
+    latencies = [float(value) for value in range(1, 101)]
+
+    assert [percentile(latencies, q) for q in (50, 95, 99)] == [50.0, 95.0, 99.0]
+    assert percentile([], 50) == 0.0
+
+
+@pytest.mark.anyio
+async def test_generate():
+    storage = InMemoryDatabase()
+
+    hub_members = await generate(storage, hubs=2, members=11, like_density=0.5, seed=1)
+
+    assert [len(member_ids) for member_ids in hub_members.values()] == [11, 11]
+
+    for hub_id, member_ids in hub_members.items():
+        like, _ = storage.like_state(member_ids[0])
+
+        assert len(like) == 5 and like <= set(member_ids)
+
+
+def test_only_scratch_databases_are_seeded():
+    check_scratch(InMemoryDatabase())
+    check_scratch(MongoDB(uri="mongodb://localhost", database="app_bench"))
+
+    for storage in (MongoDB(uri="mongodb://localhost", database="app"),
+                    InMemoryDatabase(snapshot=MongoDB(uri="mongodb://localhost", database="app"))):
+        with pytest.raises(ValueError):
+            check_scratch(storage)
+
+
+def test_compare():
+    def run(p95_ms):
+        return {"results": [{"endpoint": "users", "concurrency": 8, "p95_ms": p95_ms}]}
+
+    assert compare(run(10.0), run(11.0), tolerance=0.2)[0]["regression"] is False
+    assert compare(run(10.0), run(13.0), tolerance=0.2)[0]["regression"] is True
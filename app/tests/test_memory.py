@@ -0,0 +1,140 @@
+import asyncio
+import datetime
+
+import pytest
+
+from app.database.database import MongoDB, create_database
+from app.database.memory import InMemoryDatabase
+from app.database.repository import Repository
+from app.models.hubs import Hub
+from app.models.user import TelegramUser, TelegramUserInfo, UserUpdate, UsersResponseItem
+from app.utils.events import EventHub, UnixSocketBroker
+
+
+@pytest.fixture
+async def memory():
+    database = InMemoryDatabase()
+    await database.add_hub(Hub(hub_id=7, hub_nm="Hub"))
+
+    for user_id in (1, 2, 3, 4):
+        await database.update_or_create_user(login(user_id), TelegramUserInfo(about="About"))
+
+    return database
+
+
+def login(user_id: int) -> TelegramUser:
+    return TelegramUser(id=user_id, first_name="First", last_name="Last", username=f"user{user_id}",
+                        language_code="en", start_param=7)
+
+
+@pytest.mark.parametrize("implementation", [MongoDB, InMemoryDatabase])
+def test_implements_repository(implementation):
+    members = [name for name in vars(Repository) if not name.startswith("_")]
+
+    assert all(callable(getattr(implementation, name)) for name in members if name not in ("events",))
+
+
+def test_create_database():
+    assert isinstance(create_database("memory"), InMemoryDatabase)
+
+    with pytest.raises(ValueError):
+        create_database("sqlite")
+
+
+@pytest.mark.anyio
+async def test_feed_pages(memory: InMemoryDatabase):
+    await memory.like(2, 1)
+
+    users = await memory.all_users(1, 7, limit=2)
+
+    assert [(user["id"], user["likesYou"]) for user in users] == [(2, True), (3, False)]
+    assert [user["id"] for user in await memory.all_users(1, 7, after=3)] == [4]
+    # Items are written to the response as they are, so they must be exactly what the response model dumps.
+    assert users[0] == UsersResponseItem.model_validate(users[0]).model_dump()
+    assert (await memory.get_current_user(1)).hub_id == 7
+
+
+@pytest.mark.anyio
+async def test_likes_and_mutual_matches(memory: InMemoryDatabase):
+    assert await memory.like(2, 1) is False
+    assert await memory.like(1, 2) is True
+    assert [user.user_id for user in await memory.mutual_matches(2)] == [1]
+
+    assert await memory.like_many(1, [(2, False), (3, True), (3, False), (4, True)]) == [False, False, False, False]
+    assert memory.like_state(1) == ({4}, {2})
+    assert await memory.mutual_matches(2) == []
+
+
+@pytest.mark.anyio
+async def test_changes_since(memory: InMemoryDatabase):
+    await memory.like(1, 2)
+    since = datetime.datetime.now()
+
+    await memory.update_or_create_user(login(2), TelegramUserInfo(about="About"))
+    await memory.update_user(3, UserUpdate(about="Hi", age="30", name="Third"))
+    await memory.like(1, 2)
+
+    users, edges = await memory.users_since(1, 7, since)
+
+    assert [(user["id"], user["age"]) for user in users] == [(3, 30)]
+    assert [(edge.user_id, edge.like) for edge in edges] == [(2, False)]
+
+
+@pytest.mark.anyio
+async def test_snapshot_needs_shared_broker():
+    with pytest.raises(RuntimeError):
+        await InMemoryDatabase(snapshot=MongoDB(uri="mongodb://localhost", database="app")).start()
+
+
+def replica(snapshot: MongoDB, directory, name: str) -> InMemoryDatabase:
+    return InMemoryDatabase(EventHub(UnixSocketBroker(str(directory), name=name)), snapshot=snapshot)
+
+
+async def started(database: InMemoryDatabase) -> InMemoryDatabase:
+    await database.events.start()
+    await database.start()
+
+    return database
+
+
+@pytest.mark.anyio
+async def test_snapshot_writes_reach_mongo(scratch_database: MongoDB, tmp_path):
+    first = await started(replica(scratch_database, tmp_path, "first"))
+    # Loaded before anything was written, as a worker that started earlier.
+    second = await started(replica(MongoDB(uri=scratch_database.uri, database=scratch_database.database_name),
+                                   tmp_path, "second"))
+
+    await first.add_hub(Hub(hub_id=7, hub_nm="Hub"))
+
+    for user_id in (1, 2):
+        await first.update_or_create_user(login(user_id), TelegramUserInfo(about="About"))
+
+    # Read from MongoDB on a miss, though the second worker has not seen the login.
+    assert (await second.get_current_user(1)).hub_id == 7
+
+    await first.update_user(1, UserUpdate(about="Hi", age="30", name="First"))
+    assert await first.like(2, 1) is False
+    assert await first.like(1, 2) is True
+    assert await first.like_many(2, [(1, False), (1, True)]) == [True, True]
+
+    for _ in range(100):
+        if second.users.get(1) and second.users[1].about == "Hi" and await second.mutual_matches(2):
+            break
+
+        await asyncio.sleep(0.01)
+
+    assert [user.user_id for user in await second.mutual_matches(2)] == [1]
+    assert [user["id"] for user in await second.all_users(2, 7)] == [1]
+
+    for database in (first, second):
+        await database.close()
+        await database.events.close()
+
+    # A restarted replica loads everything the first one wrote.
+    restarted = await started(replica(scratch_database, tmp_path, "restarted"))
+
+    assert (await restarted.get_user(1)).about == "Hi"
+    assert (await restarted.get_current_user(2)).hub_id == 7
+    assert [user.user_id for user in await restarted.mutual_matches(2)] == [1]
+    await restarted.close()
+    await restarted.events.close()
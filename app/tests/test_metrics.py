@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+
+from app.utils.metrics import Histogram, Metrics, MetricsMiddleware, RequestTimings, current_timings, phase, untimed
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, route="/users")
+
+    assert histogram.render()[2:] == [
+        'latency_seconds_bucket{route="/users",le="0.1"} 1',
+        'latency_seconds_bucket{route="/users",le="1"} 2',
+        'latency_seconds_bucket{route="/users",le="+Inf"} 3',
+        'latency_seconds_sum{route="/users"} 5.55',
+        'latency_seconds_count{route="/users"} 3',
+    ]
+
+
+def test_server_timing_value():
+    timings = RequestTimings()
+    timings.add_mongo_command(0.0015)
+    timings.add_mongo_command(0.0005)
+
+    assert timings.server_timing(0.01) == ('db;dur=2.0;desc="2 commands", telegram;dur=0.0, serialize;dur=0.0, '
+                                           'total;dur=10.0')
+
+
+@pytest.mark.anyio
+async def test_background_tasks_are_not_timed():
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+
+    async def background():
+        with phase("telegram"):
+            await asyncio.sleep(0)
+
+    try:
+        await asyncio.ensure_future(untimed(background()))
+
+        assert timings.phases["telegram"] == 0.0
+        assert current_timings.get() is timings
+    finally:
+        current_timings.reset(token)
+
+
+@pytest.mark.anyio
+async def test_server_timing_header_and_route_metrics():
+    registry = Metrics()
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.get("/users/{user_id}")
+    async def get_user(user_id: int):
+        with phase("telegram"):
+            await asyncio.sleep(0.01)
+
+        return {"id": user_id}
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/users/1")
+        await client.get("/missing")
+
+    assert "telegram;dur=" in response.headers["server-timing"]
+    assert registry.requests.value(method="GET", route="/users/{user_id}", status="200") == 1
+    assert registry.requests.value(method="GET", route="unmatched", status="404") == 1
+    assert registry.phases.count(method="GET", route="/users/{user_id}", phase="telegram") == 1
+
+
+@pytest.mark.anyio
+async def test_metrics_endpoint(client: AsyncClient):
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert "auth_access_token_cache_saved_cpu_seconds" in response.text
+    assert "telegram_scheduler_queue_depth 0" in response.text
+    assert "telegram_scheduler_wait_seconds_max" in response.text
+    assert "current_user_cache_hits" in response.text
+    assert "static_image_cache_bytes" in response.text
+    assert "telegram_user_info_cache_misses" in response.text
@@ -0,0 +1,60 @@
+import logging
+from types import SimpleNamespace
+
+from app.database.monitoring import CommandMonitor, QueryReport, command_shape, documents_returned
+from app.utils.metrics import RequestTimings, current_timings
+
+
+def test_command_shape():
+    assert command_shape("find", {"find": "matches", "filter": {"$or": [
+        {"first_user_id": 1, "second_user_id": 2}, {"first_user_id": 3, "second_user_id": 4}
+    ]}}) == ("matches", 'find {"$or":[{"first_user_id":"?","second_user_id":"?"}]}')
+    assert command_shape("aggregate", {"aggregate": "hub_x_user", "pipeline": [
+        {"$match": {"hub_id": 1}}, {"$lookup": {}}
+    ]}) == ("hub_x_user", 'aggregate ["$match","$lookup"]')
+    assert command_shape("update", {"update": "users", "updates": [{"q": {"user_id": 1}, "u": {}}]}) == (
+        "users", 'update {"user_id":"?"}')
+    assert command_shape("getMore", {"getMore": 1, "collection": "users"}) == ("users", "getMore")
+
+
+def test_documents_returned():
+    assert documents_returned({"cursor": {"firstBatch": [{}, {}]}}) == 2
+    assert documents_returned({"value": None}) == 0
+    assert documents_returned({"values": [1, 2, 3]}) == 3
+    assert documents_returned({"n": 1}) == 1
+
+
+def run_command(monitor: CommandMonitor, request_id: int, duration_micros: int = 1000) -> None:
+    monitor.started(SimpleNamespace(request_id=request_id, command_name="find",
+                                    command={"find": "hub_x_user", "filter": {"user_id": request_id}}))
+    monitor.succeeded(SimpleNamespace(request_id=request_id, duration_micros=duration_micros,
+                                      reply={"cursor": {"firstBatch": [{}]}}))
+
+
+def test_commands_are_attributed_to_the_request(caplog):
+    report = QueryReport()
+    monitor = CommandMonitor(slow_query_ms=50, max_commands=2, report=report)
+    timings = RequestTimings({"route": SimpleNamespace(path="/user")})
+    token = current_timings.set(timings)
+
+    try:
+        with caplog.at_level(logging.WARNING, logger="app.database.monitoring"):
+            for request_id in range(3):
+                run_command(monitor, request_id, duration_micros=60000 if request_id == 0 else 1000)
+    finally:
+        current_timings.reset(token)
+
+    assert timings.mongo_commands == 3
+    assert [record.getMessage().split(":")[0] for record in caplog.records] == [
+        "Slow Mongo command on /user", "/user issued more than 2 Mongo commands"]
+    assert "3 x hub_x_user.find" in caplog.records[1].getMessage()
+
+    stats = report.summary()["/user"]['hub_x_user.find {"user_id":"?"}']
+    assert stats["count"] == 3 and stats["documents"] == 3 and stats["max_ms"] == 60
+
+
+def test_commands_outside_requests():
+    report = QueryReport()
+    run_command(CommandMonitor(report=report), 1)
+
+    assert list(report.summary()) == ["background"]
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+from app.bot.photos import PhotoDownloader
+from app.bot.scheduler import BotScheduler
+from app.database.migrations import legacy_photos
+from app.utils.utils import photo_url
+
+
+class FakeBot:
+    def __init__(self):
+        self.downloads = 0
+        self.release = asyncio.Event()
+
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path=f'photos/{file_id}.jpg')
+
+    async def download_file(self, file_path, destination):
+        self.downloads += 1
+        await self.release.wait()
+
+        with open(destination, 'wb') as f:
+            f.write(file_path.encode())
+
+
+def photo(unique_id: str):
+    return SimpleNamespace(small_file_id=f'small-{unique_id}', big_file_id=f'big-{unique_id}',
+                           big_file_unique_id=unique_id)
+
+
+def content_name(content: bytes) -> str:
+    return f'{hashlib.sha256(content).hexdigest()[:32]}.jpg'
+
+
+@pytest.mark.anyio
+async def test_photo_variants_are_stored_under_content_hashes(tmp_path):
+    bot = FakeBot()
+    bot.release.set()
+    downloader = PhotoDownloader(bot, BotScheduler(), directory=str(tmp_path))
+    stored = {}
+
+    async def on_stored(user_id, variants):
+        stored[user_id] = variants
+
+    downloader.on_stored = on_stored
+
+    await downloader.schedule(1, photo('a'))
+
+    files = {"small": content_name(b'photos/small-a.jpg'), "big": content_name(b'photos/big-a.jpg')}
+
+    assert downloader.variants(1) == stored[1] == {**files, "file_unique_id": "a"}
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(files.values())
+
+
+@pytest.mark.anyio
+async def test_photo_stored_elsewhere_is_not_downloaded_again(tmp_path):
+    bot = FakeBot()
+    bot.release.set()
+    # As saved by another worker or before a restart.
+    saved = {"small": "small.jpg", "big": "big.jpg", "file_unique_id": "a"}
+    downloader = PhotoDownloader(bot, BotScheduler(), directory=str(tmp_path))
+
+    async def load_stored(user_id):
+        return saved
+
+    downloader.load_stored = load_stored
+
+    await downloader.schedule(1, photo('a'))
+
+    assert bot.downloads == 0
+    assert downloader.variants(1) == saved
+    assert downloader.schedule(1, photo('a')) is None
+
+    await downloader.schedule(1, photo('b'))
+
+    assert bot.downloads == 2
+
+
+@pytest.mark.anyio
+async def test_photo_downloads_are_deduplicated(tmp_path):
+    bot = FakeBot()
+    downloader = PhotoDownloader(bot, BotScheduler(), directory=str(tmp_path))
+
+    first = downloader.schedule(1, photo('a'))
+    second = downloader.schedule(1, photo('a'))
+
+    assert first is second
+
+    bot.release.set()
+    await first
+
+    assert bot.downloads == 2
+
+
+@pytest.mark.anyio
+async def test_unchanged_photo_is_not_downloaded_again(tmp_path):
+    bot = FakeBot()
+    bot.release.set()
+    downloader = PhotoDownloader(bot, BotScheduler(), directory=str(tmp_path))
+
+    await downloader.schedule(1, photo('a'))
+
+    assert downloader.schedule(1, photo('a')) is None
+
+    await downloader.schedule(1, photo('b'))
+
+    assert bot.downloads == 4
+
+
+@pytest.mark.anyio
+async def test_close_waits_for_downloads(tmp_path):
+    bot = FakeBot()
+    downloader = PhotoDownloader(bot, BotScheduler(), directory=str(tmp_path))
+    downloads = [downloader.schedule(1, photo('a')), downloader.schedule(2, photo('b'))]
+
+    await asyncio.sleep(0)
+    asyncio.get_running_loop().call_later(0.01, bot.release.set)
+    await downloader.close()
+
+    assert all(download.done() and not download.cancelled() for download in downloads)
+    assert downloader.variants(2) is not None
+
+    # Downloads still running after the timeout are cancelled and leave no partial files.
+    bot.release.clear()
+    stuck = downloader.schedule(3, photo('c'))
+    await downloader.close(timeout=0.01)
+
+    assert stuck.cancelled()
+    assert list(tmp_path.glob('.*.part')) == []
+
+
+def test_photo_url():
+    assert photo_url({"small": "abc.jpg"}, "small") == 'api/static/images/abc.jpg'
+    # Photos are only stored under content hashes, so there is nothing to link before the download finishes.
+    assert photo_url(None, "small") is None
+    assert photo_url({"small": "abc.jpg"}, "big") is None
+
+
+def test_legacy_photos(tmp_path):
+    (tmp_path / '1.jpg').write_bytes(b'photo')
+
+    assert legacy_photos('1', str(tmp_path)) == {"small": "1.jpg", "big": "1.jpg"}
+    assert legacy_photos('2', str(tmp_path)) is None
+    assert legacy_photos(None, str(tmp_path)) is None
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetChat
+
+from app.bot.scheduler import BotScheduler, Priority, SchedulerClosed, SchedulerOverloaded
+
+
+@pytest.mark.anyio
+async def test_interactive_calls_jump_ahead_of_background():
+    scheduler = BotScheduler(rate=1000, burst=1)
+    order = []
+
+    async def call(name):
+        order.append(name)
+
+    # Drains the only token so the next calls queue up.
+    await scheduler.call(lambda: call("first"))
+
+    await asyncio.gather(
+        scheduler.call(lambda: call("background"), Priority.BACKGROUND),
+        scheduler.call(lambda: call("interactive"), Priority.INTERACTIVE),
+    )
+
+    assert order == ["first", "interactive", "background"]
+    assert scheduler.stats()["dispatched"] == 3
+
+    await scheduler.close()
+
+
+@pytest.mark.anyio
+async def test_retry_after_is_honored():
+    scheduler = BotScheduler(rate=1000, burst=10)
+    attempts = []
+
+    async def flaky():
+        attempts.append(time.monotonic())
+
+        if len(attempts) == 1:
+            raise TelegramRetryAfter(method=GetChat(chat_id=1), message="Too Many Requests", retry_after=0.05)
+
+        return "ok"
+
+    assert await scheduler.call(flaky) == "ok"
+    assert attempts[1] - attempts[0] >= 0.045
+    assert scheduler.retried == 1
+
+    await scheduler.close()
+
+
+@pytest.mark.anyio
+async def test_bucket_does_not_refill_during_retry_after():
+    scheduler = BotScheduler(rate=20, burst=5)
+    attempts = []
+
+    async def flaky():
+        attempts.append(time.monotonic())
+
+        if len(attempts) == 1:
+            raise TelegramRetryAfter(method=GetChat(chat_id=1), message="Too Many Requests", retry_after=0.05)
+
+    async def noop():
+        pass
+
+    await scheduler.call(flaky)
+    started = time.monotonic()
+    await asyncio.gather(scheduler.call(noop), scheduler.call(noop))
+
+    # Two more tokens at 20 per second, rather than a burst left over from before the pause.
+    assert time.monotonic() - started >= 0.08
+
+    await scheduler.close()
+
+
+@pytest.mark.anyio
+async def test_full_queue_is_rejected():
+    scheduler = BotScheduler(rate=0.001, burst=1, max_queue=1)
+
+    async def noop():
+        pass
+
+    await scheduler.call(noop)
+    queued = asyncio.ensure_future(scheduler.call(noop))
+    await asyncio.sleep(0)
+
+    with pytest.raises(SchedulerOverloaded):
+        await scheduler.call(noop)
+
+    assert scheduler.stats()["queue_depth"] == 1
+    assert scheduler.rejected == 1
+
+    queued.cancel()
+    await scheduler.close()
+
+
+@pytest.mark.anyio
+async def test_close_fails_queued_calls():
+    scheduler = BotScheduler(rate=0.001, burst=1)
+
+    async def noop():
+        pass
+
+    await scheduler.call(noop)
+    queued = asyncio.ensure_future(scheduler.call(noop, Priority.BACKGROUND))
+    await asyncio.sleep(0)
+
+    await scheduler.close()
+
+    with pytest.raises(SchedulerClosed):
+        await queued
+
+    assert scheduler.stats()["queue_depth"] == 0
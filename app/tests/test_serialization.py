@@ -0,0 +1,9 @@
+from app.benchmarks.serialization import run
+
+
+def test_serialization_paths_agree():
+    # run() asserts both paths write the same items.
+    [result] = run([20], repeat=1, seed=1)
+
+    assert (result["members"], result["projected_by"]) == (20, "python")
+    assert result["projected_bson_bytes_per_item"] < result["full_bson_bytes_per_item"]
@@ -0,0 +1,69 @@
+import pytest
+from httpx import AsyncClient
+
+from app.api import static
+
+
+@pytest.fixture
+def images_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(static, "IMAGES_DIR", str(tmp_path))
+    monkeypatch.setattr(static, "images", static.BytesLRU(max_bytes=1024, max_item_bytes=16))
+
+    return tmp_path
+
+
+@pytest.mark.anyio
+async def test_static_image_conditional_get(client: AsyncClient, images_dir):
+    (images_dir / "1.jpg").write_bytes(b"image")
+
+    response = await client.get("/static/images/1.jpg")
+
+    assert response.status_code == 200
+    assert response.content == b"image"
+    assert response.headers["cache-control"] == static.MUTABLE_CACHE_CONTROL
+
+    etag = response.headers["etag"]
+    response = await client.get("/static/images/1.jpg", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.anyio
+async def test_static_image_changes_etag(client: AsyncClient, images_dir):
+    (images_dir / "1.jpg").write_bytes(b"image")
+    etag = (await client.get("/static/images/1.jpg")).headers["etag"]
+
+    (images_dir / "1.jpg").write_bytes(b"new image")
+    response = await client.get("/static/images/1.jpg", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.content == b"new image"
+
+
+@pytest.mark.anyio
+async def test_static_large_image_is_streamed_from_disk(client: AsyncClient, images_dir):
+    (images_dir / "1.jpg").write_bytes(b"x" * 32)
+
+    response = await client.get("/static/images/1.jpg")
+
+    assert response.status_code == 200
+    assert len(response.content) == 32
+    assert len(static.images) == 0
+
+
+@pytest.mark.anyio
+async def test_static_content_addressed_image_is_immutable(client: AsyncClient, images_dir):
+    filename = "0123456789abcdef0123456789abcdef.jpg"
+    (images_dir / filename).write_bytes(b"image")
+
+    response = await client.get(f"/static/images/{filename}")
+
+    assert response.headers["cache-control"] == static.IMMUTABLE_CACHE_CONTROL
+
+
+@pytest.mark.anyio
+async def test_static_missing_image(client: AsyncClient, images_dir):
+    response = await client.get("/static/images/missing.jpg")
+
+    assert response.status_code == 404
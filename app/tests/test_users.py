@@ -1,8 +1,20 @@
+import datetime
+import json
+
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
 
+from app.api import users as users_api
+from app.api.auth import get_current_user
+from app.api.users import stream_json_array, stream_ndjson
+from app.database.database import MongoDB, database
 from app.main import app
+from app.models.matches import LikeEdge
+from app.models.user import TelegramUser, TelegramUserInfo, UserCurrent, UsersFeedItem
+from app.utils.cache import TTLCache
+from app.utils.utils import decode_cursor, decode_sync_token, encode_cursor, encode_sync_token
 
 client = TestClient(app)
 
@@ -19,3 +31,153 @@ async def test_users(client: AsyncClient):
     )
 
     assert response.status_code == 200
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(104343318)) == 104343318
+    assert decode_cursor(None) is None
+
+
+def test_invalid_cursor():
+    with pytest.raises(HTTPException) as e:
+        decode_cursor("not-a-cursor")
+
+    assert e.value.status_code == 400
+
+
+def test_sync_token_round_trip():
+    since = datetime.datetime(2024, 1, 2, 3, 4, 5, 6789)
+
+    assert decode_sync_token(encode_sync_token(since)) == since
+
+    with pytest.raises(HTTPException):
+        decode_sync_token(encode_cursor(1))
+
+
+def feed_item(user_id: int, likes_you: bool = False) -> UsersFeedItem:
+    return UsersFeedItem(id=user_id, about=None, age=None, firstName="first", lastName=None, photo=None,
+                         nickname="user", workingName="first", like=False, likesYou=likes_you)
+
+
+async def _members(count: int):
+    for user_id in range(count):
+        yield feed_item(user_id, likes_you=bool(user_id % 2))
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("count", [0, 1, 3])
+async def test_stream_json_array(count: int):
+    body = b"".join([chunk async for chunk in stream_json_array(_members(count))])
+
+    assert [item["id"] for item in json.loads(body)] == list(range(count))
+
+
+@pytest.mark.anyio
+async def test_stream_ndjson():
+    lines = [chunk async for chunk in stream_ndjson(_members(3))]
+
+    assert [json.loads(line)["likesYou"] for line in lines] == [False, True, False]
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """Serves /users for user 1 in hub 1 from a fake all_users that counts its calls."""
+    calls = []
+
+    async def all_users(user_id, hub_id, after=None, limit=None):
+        calls.append((user_id, hub_id))
+
+        return [feed_item(2)]
+
+    monkeypatch.setattr(database, "all_users", all_users)
+    monkeypatch.setattr(users_api, "feed_cache", TTLCache(ttl=60))
+    app.dependency_overrides[get_current_user] = lambda: UserCurrent(
+        user_id=1, hub_id=1, first_name="first", username="user")
+
+    yield calls
+
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.anyio
+async def test_feed_not_modified(client: AsyncClient, feed):
+    response = await client.get("/users")
+
+    assert response.status_code == 200
+    assert response.json()["items"][0]["id"] == 2
+
+    etag = response.headers["etag"]
+    response = await client.get("/users", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert len(feed) == 1
+
+
+@pytest.mark.anyio
+async def test_feed_etag_changes_with_likes(client: AsyncClient, feed):
+    etag = (await client.get("/users")).headers["etag"]
+
+    database.viewer_versions.bump(1)
+    response = await client.get("/users", headers={"If-None-Match": etag})
+
+    # The page is rendered again, but its bytes did not change.
+    assert response.status_code == 304
+    assert len(feed) == 2
+
+    database.hub_versions.bump(1)
+    await client.get("/users")
+
+    assert len(feed) == 3
+
+
+@pytest.mark.anyio
+async def test_feed_delta(client: AsyncClient, feed, monkeypatch):
+    calls = []
+
+    async def users_since(user_id, hub_id, since):
+        calls.append(since)
+
+        return [], [LikeEdge(user_id=3, like=False, likes_you=False)]
+
+    monkeypatch.setattr(database, "users_since", users_since)
+
+    sync = (await client.get("/users")).json()["sync"]
+    response = await client.get("/users", params={"since": sync})
+
+    assert response.status_code == 200
+    assert response.json()["items"] == []
+    assert response.json()["likes"] == [{"id": 3, "like": False, "likesYou": False}]
+    assert calls == [decode_sync_token(sync)]
+    assert decode_sync_token(response.json()["sync"]) >= calls[0]
+
+
+@pytest.mark.anyio
+async def test_feed_changes_since(scratch_database: MongoDB):
+    await scratch_database.db.hubs.insert_one({"hub_id": 7, "hub_nm": "Hub"})
+
+    def login(user_id: int, about: str = "About"):
+        telegram_user = TelegramUser(id=user_id, first_name="First", last_name="Last", username=f"user{user_id}",
+                                     language_code="en", start_param=7)
+
+        return scratch_database.update_or_create_user(telegram_user, TelegramUserInfo(about=about))
+
+    for user_id in (1, 2, 3):
+        await login(user_id)
+
+    await scratch_database.like(1, 2)
+    await scratch_database.like(1, 3)
+
+    since = datetime.datetime.now()
+
+    # Logging in again without changes is not a profile change.
+    await login(2)
+    await login(4)
+    await scratch_database.update_user_photos(3, {"small": "small.jpg"})
+    await scratch_database.like(1, 2)
+
+    users, edges = await scratch_database.users_since(1, 7, since)
+
+    assert [user["id"] for user in users] == [3, 4]
+    assert users[0]["like"] is True
+    assert users[0]["photo"] == "api/static/images/small.jpg"
+    assert [(edge.user_id, edge.like, edge.likes_you) for edge in edges] == [(2, False, False)]
@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import hmac
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+
+class TTLCache:
+    """A size-bounded in-process cache whose entries expire after a fixed time to live."""
+
+    def __init__(self, ttl: float, maxsize: int = 10000) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        self._key_tags: Dict[Hashable, Hashable] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value or None if it is missing or expired."""
+        entry = self._entries.get(key)
+
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self.delete(key)
+
+            self.misses += 1
+
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, tag: Hashable = None) -> None:
+        """Stores a value. Entries sharing a tag can be dropped together with invalidate_tag."""
+        self.delete(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+        if tag is not None:
+            self._tags.setdefault(tag, set()).add(key)
+            self._key_tags[key] = tag
+
+        while len(self._entries) > self.maxsize:
+            self.delete(next(iter(self._entries)))
+
+    def delete(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+        tag = self._key_tags.pop(key, None)
+
+        if tag is not None:
+            keys = self._tags[tag]
+            keys.discard(key)
+
+            if not keys:
+                del self._tags[tag]
+
+    def invalidate_tag(self, tag: Hashable) -> None:
+        """Drops every entry stored with the tag."""
+        for key in list(self._tags.get(tag, ())):
+            self.delete(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tags.clear()
+        self._key_tags.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class BytesLRU:
+    """A least recently used cache bounded by the total size of the stored byte strings."""
+
+    def __init__(self, max_bytes: int, max_item_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Tuple[bytes, Any]]:
+        """Returns the stored content and its metadata or None."""
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return entry
+
+    def set(self, key: Hashable, content: bytes, metadata: Any = None) -> bool:
+        """Stores the content unless it exceeds max_item_bytes. Returns whether it was stored."""
+        self.delete(key)
+
+        if len(content) > self.max_item_bytes:
+            return False
+
+        self._entries[key] = (content, metadata)
+        self.size += len(content)
+
+        while self.size > self.max_bytes:
+            self.delete(next(iter(self._entries)))
+
+        return True
+
+    def delete(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+class VersionCounter:
+    """Per-key version numbers for building validators of derived data.
+
+    The epoch differs between processes, so validators issued by another worker or before a restart never match.
+    """
+
+    def __init__(self) -> None:
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions: Dict[Hashable, int] = {}
+
+    def get(self, key: Hashable) -> int:
+        return self._versions.get(key, 0)
+
+    def bump(self, *keys: Hashable) -> None:
+        for key in keys:
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single in-flight task."""
+
+    def __init__(self) -> None:
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    def start(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Returns the task running for the key, starting factory() if there is none."""
+        task = self._tasks.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+        return task
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Awaits the shared task. A cancelled caller does not cancel it for the others."""
+        return await asyncio.shield(self.start(key, factory))
+
+    async def wait(self, timeout: Optional[float] = None) -> None:
+        """Waits for the in-flight tasks, cancelling the ones still running after timeout seconds."""
+        tasks = list(self._tasks.values())
+
+        if not tasks:
+            return
+
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+
+        for task in pending:
+            task.cancel()
+
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+class VerifiedCache:
+    """A bounded LRU of verified credentials mapped to what verifying them produced, e.g. decoded claims.
+
+    Only a SHA-256 digest of each credential is kept. Entries are found by a digest prefix and confirmed by
+    comparing the full digest in constant time, and each one expires at the deadline its verification returned.
+    The thread CPU time of every verification is measured, so each hit is credited with the average cost.
+    """
+
+    def __init__(self, maxsize: int = 10000) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.verify_seconds = 0.0
+        self.saved_seconds = 0.0
+        # Digest prefix -> (full digest, expires at as a Unix time, value).
+        self._entries: "OrderedDict[bytes, Tuple[bytes, float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def verify(self, credential: str, verify: Callable[[str], Tuple[Any, float]]) -> Any:
+        """Returns the cached result for the credential, running verify(credential) on a miss.
+
+        Args:
+            credential: The raw token as received.
+            verify: Checks the credential and returns the result with the Unix time it stops being valid.
+                Exceptions propagate and nothing is cached.
+
+        Returns:
+            Any: The result of verify(credential).
+        """
+
+        digest = hashlib.sha256(credential.encode()).digest()
+        key = digest[:16]
+        entry = self._entries.get(key)
+
+        if entry is not None and hmac.compare_digest(entry[0], digest):
+            if entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += self.verify_seconds / self.misses
+
+                return entry[2]
+
+            del self._entries[key]
+
+        started_at = time.thread_time()
+        value, expires_at = verify(credential)
+        self.verify_seconds += time.thread_time() - started_at
+        self.misses += 1
+
+        if expires_at > time.time():
+            self._entries[key] = (digest, expires_at, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "verify_cpu_seconds": self.verify_seconds,
+            "saved_cpu_seconds": self.saved_seconds,
+        }
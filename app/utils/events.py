@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import socket
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from app.models.events import Event
+from app.settings import EVENT_BROKER, EVENT_BROKER_DIR, EVENT_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def user_channel(user_id: int) -> str:
+    return f'user:{user_id}'
+
+
+def hub_channel(hub_id: int) -> str:
+    return f'hub:{hub_id}'
+
+
+class Subscription:
+    """Encoded events queued for one connection. A client too slow to keep up is marked as overflowed."""
+
+    def __init__(self, channels: Set[str], maxsize: int = EVENT_QUEUE_SIZE) -> None:
+        self.channels = channels
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, message: str) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Broker:
+    """Carries events published by one worker to the other workers."""
+
+    # Whether other workers may have subscribers, so events must be published even without local ones.
+    shared = False
+
+    async def start(self, deliver: Callable[[str, str], None]) -> None:
+        """Starts passing events published by other workers to deliver(channel, message)."""
+
+    def send(self, channel: str, message: str) -> None:
+        """Sends an encoded event to the other workers."""
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalBroker(Broker):
+    """A single worker: there is nobody to share events with."""
+
+
+class UnixSocketBroker(Broker):
+    """Shares events between workers on one host through Unix datagram sockets in a common directory.
+
+    Every worker binds one socket and sends each event to all the others. A stand-in for a network broker
+    such as Redis pub/sub; events are dropped rather than queued when a peer is not reading.
+    """
+
+    shared = True
+
+    def __init__(self, directory: str = EVENT_BROKER_DIR, name: Optional[str] = None) -> None:
+        self.directory = directory
+        self.path = os.path.join(directory, f'{name or os.getpid()}.sock')
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._sender: Optional[socket.socket] = None
+
+    async def start(self, deliver: Callable[[str, str], None]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        # Bound by hand: uvloop only accepts host and port tuples as local_addr.
+        receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.bind(self.path)
+        receiver.setblocking(False)
+
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _DatagramProtocol(deliver), sock=receiver)
+
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+
+    def send(self, channel: str, message: str) -> None:
+        if self._sender is None:
+            return
+
+        payload = f'{channel}\n{message}'.encode()
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+
+            if path == self.path or not name.endswith('.sock'):
+                continue
+
+            try:
+                self._sender.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker is gone without cleaning up its socket.
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                logger.warning("Could not send an event to %s: %s", path, e)
+
+    async def close(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+        if self._sender is not None:
+            self._sender.close()
+            self._sender = None
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, deliver: Callable[[str, str], None]) -> None:
+        self.deliver = deliver
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        channel, _, message = data.decode().partition('\n')
+        self.deliver(channel, message)
+
+
+BROKERS: Dict[str, Callable[[], Broker]] = {
+    "local": LocalBroker,
+    "unix": UnixSocketBroker,
+}
+
+
+def create_broker(name: str = EVENT_BROKER) -> Broker:
+    if name not in BROKERS:
+        raise ValueError(f"Unknown event broker {name!r}, expected one of {', '.join(BROKERS)}")
+
+    return BROKERS[name]()
+
+
+class EventHub:
+    """In-process pub/sub of client events by channel. Events are encoded once and shared by all subscribers."""
+
+    def __init__(self, broker: Optional[Broker] = None, queue_size: int = EVENT_QUEUE_SIZE) -> None:
+        self.broker = broker if broker is not None else LocalBroker()
+        self.queue_size = queue_size
+        self.published = 0
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._listeners: List[Callable[[str, Event], None]] = []
+
+    async def start(self) -> None:
+        await self.broker.start(self._receive)
+
+    def listen(self, listener: Callable[[str, Event], None]) -> None:
+        """Calls listener(channel, event) for every event published by another worker."""
+        self._listeners.append(listener)
+
+    async def close(self) -> None:
+        await self.broker.close()
+
+    def publish(self, channel: str, event: Event) -> None:
+        """Delivers the event to the channel's subscribers in this and every other worker."""
+
+        if not self.broker.shared and channel not in self._subscriptions:
+            return
+
+        message = event.model_dump_json()
+        self.published += 1
+
+        self.deliver(channel, message)
+        self.broker.send(channel, message)
+
+    def _receive(self, channel: str, message: str) -> None:
+        if self._listeners:
+            event = Event.model_validate_json(message)
+
+            for listener in self._listeners:
+                try:
+                    listener(channel, event)
+                except Exception as e:
+                    logger.warning("Could not handle a %s event on %s: %s", event.type.value, channel, e)
+
+        self.deliver(channel, message)
+
+    def deliver(self, channel: str, message: str) -> None:
+        for subscription in self._subscriptions.get(channel, ()):
+            subscription.put(message)
+
+    @contextmanager
+    def subscribe(self, *channels: str) -> Iterator[Subscription]:
+        """Queues the events of the channels until the block exits."""
+
+        subscription = Subscription(set(channels), self.queue_size)
+
+        for channel in subscription.channels:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+
+        try:
+            yield subscription
+        finally:
+            for channel in subscription.channels:
+                subscriptions = self._subscriptions.get(channel)
+
+                if subscriptions is not None:
+                    subscriptions.discard(subscription)
+
+                    if not subscriptions:
+                        del self._subscriptions[channel]
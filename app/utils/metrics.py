@@ -0,0 +1,237 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+PHASES = ("db", "telegram", "serialize")
+
+Labels = Tuple[Tuple[str, str], ...]
+T = TypeVar("T")
+
+
+def format_labels(labels: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in labels] + ([extra] if extra else [])
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A Prometheus counter with labels."""
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines += [f'{self.name}{format_labels(labels)} {value:g}' for labels, value in sorted(self._values.items())]
+
+        return lines
+
+
+class Histogram:
+    """A Prometheus histogram with labels and fixed buckets."""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DURATION_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # Labels -> (count per bucket, the last one being +Inf; sum).
+        self._values: Dict[Labels, Tuple[List[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = counts, total + value
+
+    def count(self, **labels: str) -> int:
+        counts, _ = self._values.get(tuple(sorted(labels.items())), ([], 0.0))
+
+        return sum(counts)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+
+            for bound, count in zip([f'{bucket:g}' for bucket in self.buckets] + ["+Inf"], counts):
+                cumulative += count
+                bucket_labels = format_labels(labels, f'le="{bound}"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+
+            lines.append(f'{self.name}_sum{format_labels(labels)} {total:g}')
+            lines.append(f'{self.name}_count{format_labels(labels)} {cumulative}')
+
+        return lines
+
+
+class RequestTimings:
+    """Time spent by one request in each phase. Mongo commands report from driver threads, hence the lock."""
+
+    def __init__(self, scope: Optional[Scope] = None) -> None:
+        self.scope = scope
+        self.phases: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.mongo_commands = 0
+        self.mongo_shapes: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def route(self) -> str:
+        """The route template, known once the request has been routed. Unmatched paths share one label."""
+        return getattr((self.scope or {}).get("route"), "path", "unmatched")
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def add_mongo_command(self, seconds: float, shape: str = "") -> int:
+        """Adds a Mongo command to the db phase. Returns the number of commands issued so far."""
+        with self._lock:
+            self.phases["db"] += seconds
+            self.mongo_commands += 1
+            self.mongo_shapes.append(shape)
+
+            return self.mongo_commands
+
+    def server_timing(self, total: float) -> str:
+        """Formats the phases as a Server-Timing header value. Concurrent calls are summed per phase."""
+        metrics = [f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in self.phases.items()]
+        metrics[0] += f';desc="{self.mongo_commands} commands"'
+
+        return ", ".join(metrics + [f'total;dur={total * 1000:.1f}'])
+
+
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Adds the time spent in the block to the current request's phase."""
+    started_at = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        timings = current_timings.get()
+
+        if timings is not None:
+            timings.add(name, time.perf_counter() - started_at)
+
+
+async def untimed(awaitable: Awaitable[T]) -> T:
+    """Runs the top-level coroutine of a background task outside the timings of the request that started it.
+
+    Tasks copy the context they are created in, so their db and telegram time would otherwise be charged to that
+    request, possibly after its Server-Timing header was written. Only clears the task's own copy of the context.
+    """
+    current_timings.set(None)
+
+    return await awaitable
+
+
+class TimedJSONResponse(JSONResponse):
+    """Counts JSON rendering towards the serialize phase."""
+
+    def render(self, content) -> bytes:
+        with phase("serialize"):
+            return super().render(content)
+
+
+class Metrics:
+    """Per-route request metrics of this worker in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self.requests = Counter("http_requests_total", "HTTP requests by route and status.")
+        self.duration = Histogram("http_request_duration_seconds", "HTTP request latency by route.")
+        self.phases = Histogram("http_request_phase_seconds", "Time spent in db, telegram and serialize per request.")
+        self.mongo_commands = Histogram("http_request_mongo_commands", "Mongo commands issued per request.",
+                                        buckets=COMMAND_COUNT_BUCKETS)
+        self._stats: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    def register_stats(self, prefix: str, stats: Callable[[], Dict[str, float]]) -> None:
+        """Exports every value returned by stats() as a gauge named {prefix}_{key}."""
+        self._stats[prefix] = stats
+
+    def observe(self, method: str, route: str, status: int, seconds: float, timings: RequestTimings) -> None:
+        self.requests.inc(method=method, route=route, status=str(status))
+        self.duration.observe(seconds, method=method, route=route)
+        self.mongo_commands.observe(timings.mongo_commands, method=method, route=route)
+
+        for name, phase_seconds in timings.phases.items():
+            self.phases.observe(phase_seconds, method=method, route=route, phase=name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        for metric in (self.requests, self.duration, self.phases, self.mongo_commands):
+            lines += metric.render()
+
+        for prefix, stats in sorted(self._stats.items()):
+            for key, value in stats().items():
+                lines += [f'# TYPE {prefix}_{key} gauge', f'{prefix}_{key} {value:g}']
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class MetricsMiddleware:
+    """Times every HTTP request, emits a Server-Timing header and records the request in Metrics."""
+
+    def __init__(self, app: ASGIApp, registry: Metrics = metrics) -> None:
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+
+            return
+
+        timings = RequestTimings(scope)
+        token = current_timings.set(timings)
+        started_at = time.perf_counter()
+        status = 500
+
+        async def send_with_timings(message: Message) -> None:
+            nonlocal status
+
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("Server-Timing",
+                                                     timings.server_timing(time.perf_counter() - started_at))
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            current_timings.reset(token)
+
+            # Route templates keep the label set bounded.
+            self.registry.observe(scope["method"], timings.route, status, time.perf_counter() - started_at, timings)
@@ -1,39 +1,74 @@
+import base64
+import datetime
+import hashlib
+import hmac
 import html
-import os
-from typing import Annotated
+import json
+import time
+from typing import Annotated, Dict, Optional, Tuple
+from urllib.parse import parse_qsl
 
-from dotenv import load_dotenv
 from fastapi import HTTPException, Depends
 from fastapi.security.http import HTTPAuthorizationCredentials, HTTPBearer
-from telegram_webapp_auth import parse_user_data, parse_init_data, validate
 
 from app.models.user import TelegramUser
+from app.settings import AUTH_CACHE_SIZE, BOT_TOKEN, INIT_DATA_MAX_AGE
+from app.utils.cache import VerifiedCache
+from app.utils.metrics import metrics
 
-load_dotenv()
+IMAGES_URL = 'api/static/images/'
 
-BOT_TOKEN = os.getenv('BOT_TOKEN')
+init_data_cache = VerifiedCache(maxsize=AUTH_CACHE_SIZE)
+metrics.register_stats("auth_init_data_cache", init_data_cache.stats)
 
 
-def verify_token(auth_cred: HTTPAuthorizationCredentials) -> TelegramUser:
-    init_data = auth_cred.credentials
+def sign_init_data(fields: Dict[str, str], bot_token: str = BOT_TOKEN) -> str:
+    """Returns the Web App initData hash of the fields, as Telegram computes it.
 
-    try:
-        if validate(init_data, BOT_TOKEN):
-            raise ValueError("Invalid hash")
-    except ValueError:
-        raise HTTPException(status_code=403, detail="Could not validate credentials")
+    The data check string is every field except hash as key=value, sorted by key and joined by newlines. The key
+    is HMAC-SHA256 of the bot token keyed by "WebAppData".
+    """
+    data_check_string = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()) if key != "hash")
+    secret_key = hmac.new(b"WebAppData", (bot_token or "").encode(), hashlib.sha256).digest()
+
+    return hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+
+
+def parse_verified_init_data(init_data: str) -> Tuple[TelegramUser, float]:
+    """Checks the initData signature and age.
+
+    Returns:
+        Tuple[TelegramUser, float]: The user and the Unix time the initData expires at.
+
+    Raises:
+        ValueError: The hash does not match or the initData is older than INIT_DATA_MAX_AGE.
+    """
+
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+
+    if not hmac.compare_digest(sign_init_data(fields), fields.get("hash", "")):
+        raise ValueError("Invalid hash")
 
-    init_data = parse_init_data(init_data)
-    user_data = parse_user_data(init_data["user"])
+    expires_at = int(fields.get("auth_date", 0)) + INIT_DATA_MAX_AGE
+
+    if expires_at <= time.time():
+        raise ValueError("Expired init data")
 
     start_param = None
 
     try:
-        start_param = int(init_data.get("start_param"))
-    except:
+        start_param = int(fields.get("start_param"))
+    except (TypeError, ValueError):
         pass
 
-    return TelegramUser(start_param=start_param, **user_data)
+    return TelegramUser(start_param=start_param, **json.loads(fields["user"])), expires_at
+
+
+def verify_token(auth_cred: HTTPAuthorizationCredentials) -> TelegramUser:
+    try:
+        return init_data_cache.verify(auth_cred.credentials, parse_verified_init_data)
+    except (ValueError, KeyError):
+        raise HTTPException(status_code=403, detail="Could not validate credentials")
 
 
 telegram_authentication_schema = HTTPBearer()
@@ -48,3 +83,58 @@ def get_telegram_user(
 def sanitize_input(input_str):
     sanitized_str = html.escape(input_str)
     return sanitized_str
+
+
+def photo_url(photos: Optional[Dict[str, str]], variant: str) -> Optional[str]:
+    """Returns the URL of a stored photo variant, or None until the photo has been downloaded."""
+    if photos and variant in photos:
+        return f'{IMAGES_URL}{photos[variant]}'
+
+    return None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Checks an If-None-Match header against the current ETag."""
+    if not if_none_match:
+        return False
+
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+
+    return "*" in tags or etag in tags or f'W/{etag}' in tags
+
+
+def encode_cursor(user_id: int) -> str:
+    """Packs the last seen user id into an opaque page cursor."""
+    payload = json.dumps({"after": user_id}, separators=(",", ":")).encode()
+
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """Unpacks a page cursor produced by encode_cursor."""
+    if not cursor:
+        return None
+
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+
+        return int(json.loads(payload)["after"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def encode_sync_token(since: datetime.datetime) -> str:
+    """Packs the time a client last synced at into an opaque delta sync token."""
+    payload = json.dumps({"since": since.isoformat()}, separators=(",", ":")).encode()
+
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> datetime.datetime:
+    """Unpacks a delta sync token produced by encode_sync_token."""
+    try:
+        payload = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+
+        return datetime.datetime.fromisoformat(json.loads(payload)["since"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid sync token")